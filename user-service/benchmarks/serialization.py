@@ -0,0 +1,107 @@
+"""
+Benchmark the member list serialization paths
+
+Compares, for the same users:
+  * response_model: validating ORM objects through List[UserInDB] and
+    encoding with the stdlib json module, as FastAPI does for response_model
+  * orjson: encoding dicts built from result tuples (app.serialization)
+  * msgpack: the same content as MessagePack
+
+Usage (from user-service/):
+
+    python benchmarks/serialization.py [--rows 5000] [--repeat 20]
+"""
+import argparse
+from datetime import date, datetime, timedelta, timezone
+import json
+from pathlib import Path
+import statistics
+import sys
+import time
+from typing import List
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "src"))
+
+from fastapi import Request  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+from app import models, schemas  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.serialization import USER_FIELDS, fast_response, rows_to_dicts  # noqa: E402
+
+LEVELS = [level.value for level in schemas.UserLevel]
+ROLES = [role.value for role in schemas.UserRole]
+
+
+def make_rows(count: int):
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(1, count + 1):
+        rows.append((
+            f"會友{i:05d}",
+            f"member{i}@example.com" if i % 3 else None,
+            date(1980, 1, 1) + timedelta(days=i % 9000),
+            f"09{i:08d}" if i % 2 else None,
+            LEVELS[i % len(LEVELS)],
+            ROLES[i % len(ROLES)],
+            i,
+            created + timedelta(minutes=i),
+            created + timedelta(days=1, microseconds=i) if i % 4 else None
+        ))
+    return rows
+
+
+def make_request(accept: str) -> Request:
+    return Request({"type": "http", "headers": [(b"accept", accept.encode())]})
+
+
+def timed(func, repeat: int):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    settings.FAST_SERIALIZATION = True
+
+    rows = make_rows(args.rows)
+    users = [models.User(**dict(zip(USER_FIELDS, row))) for row in rows]
+    adapter = TypeAdapter(List[schemas.UserInDB])
+    json_request = make_request("application/json")
+    msgpack_request = make_request("application/msgpack")
+
+    def response_model_path():
+        validated = adapter.validate_python(users, from_attributes=True)
+        content = adapter.dump_python(validated, mode="json")
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+    def orjson_path():
+        return fast_response(json_request, rows_to_dicts(rows, USER_FIELDS), utc_z=True).body
+
+    def msgpack_path():
+        return fast_response(msgpack_request, rows_to_dicts(rows, USER_FIELDS), utc_z=True).body
+
+    baseline, expected = timed(response_model_path, args.repeat)
+    results = [("response_model + json", baseline, expected)]
+    for name, func in [("orjson", orjson_path), ("msgpack", msgpack_path)]:
+        seconds, body = timed(func, args.repeat)
+        results.append((name, seconds, body))
+
+    if results[1][2] != expected:
+        sys.exit("orjson output differs from the response_model output")
+
+    print(f"{args.rows} users, median of {args.repeat} runs")
+    print(f"{'path':<24}{'ms':>10}{'bytes':>12}{'speedup':>10}")
+    for name, seconds, body in results:
+        print(f"{name:<24}{seconds * 1000:>10.2f}{len(body):>12}{baseline / seconds:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
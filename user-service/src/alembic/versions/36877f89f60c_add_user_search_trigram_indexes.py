@@ -0,0 +1,42 @@
+"""Add user search trigram indexes
+
+Revision ID: 36877f89f60c
+Revises: de31ec26d5af
+Create Date: 2026-10-18 16:42:08.318514
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '36877f89f60c'
+down_revision: Union[str, None] = 'de31ec26d5af'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Trigram GIN indexes serve ILIKE '%q%' and similarity() on any part of the text,
+# including CJK names (pg_trgm treats non-ASCII letters as word characters
+# unless the database uses the C locale)
+INDEXES = [
+    ('ix_users_name_trgm', 'users', 'name'),
+    ('ix_users_email_trgm', 'users', 'email'),
+    ('ix_users_mobile_number_trgm', 'users', 'mobile_number'),
+]
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, column in INDEXES:
+        op.create_index(
+            name, table, [column],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={column: 'gin_trgm_ops'}
+        )
+
+
+def downgrade() -> None:
+    for name, table, column in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
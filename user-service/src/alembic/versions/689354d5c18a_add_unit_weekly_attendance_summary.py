@@ -0,0 +1,82 @@
+"""Add unit_weekly_attendance_summary
+
+Revision ID: 689354d5c18a
+Revises: cd88c7d99994
+Create Date: 2026-10-18 11:27:52.904133
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '689354d5c18a'
+down_revision: Union[str, None] = 'cd88c7d99994'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'unit_weekly_attendance_summary',
+        sa.Column('unit_id', sa.Integer(), nullable=False),
+        sa.Column('week_start', sa.Date(), nullable=False),
+        sa.Column(
+            'meeting_type',
+            postgresql.ENUM('SUNDAY_SERVICE', 'GROUP_MEETING', name='meetingtype', create_type=False),
+            nullable=False
+        ),
+        sa.Column('level', sa.String(), nullable=False),
+        sa.Column('attendance_count', sa.Integer(), nullable=False),
+        sa.Column('attendee_count', sa.Integer(), nullable=False),
+        sa.Column('attendee_ids', postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column('first_record_ids', postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column('record_counts', postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['unit_id'], ['organization_units.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('unit_id', 'week_start', 'meeting_type', 'level')
+    )
+
+    # Backfill from the raw attendance records, same as `python -m app.rollup rebuild`
+    op.execute("""
+        INSERT INTO unit_weekly_attendance_summary (
+            unit_id, week_start, meeting_type, level, attendance_count,
+            attendee_count, attendee_ids, first_record_ids, record_counts
+        )
+        SELECT
+            unit_id,
+            week_start,
+            meeting_type,
+            level,
+            SUM(record_count)::integer,
+            COUNT(*)::integer,
+            array_agg(user_id ORDER BY first_record_id),
+            array_agg(first_record_id ORDER BY first_record_id),
+            array_agg(record_count::integer ORDER BY first_record_id)
+        FROM (
+            SELECT
+                members.unit_id,
+                date_trunc('week', a.meeting_date)::date AS week_start,
+                a.meeting_type,
+                u.level,
+                a.user_id,
+                COUNT(*) AS record_count,
+                MIN(a.id) AS first_record_id
+            FROM meeting_attendance a
+            JOIN (
+                SELECT DISTINCT c.ancestor_id AS unit_id, uou.user_id
+                FROM organization_unit_closure c
+                JOIN user_organization_units uou ON uou.unit_id = c.descendant_id
+            ) members ON members.user_id = a.user_id
+            JOIN users u ON u.id = a.user_id
+            GROUP BY members.unit_id, date_trunc('week', a.meeting_date)::date, a.meeting_type, u.level, a.user_id
+        ) per_user
+        GROUP BY unit_id, week_start, meeting_type, level
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('unit_weekly_attendance_summary')
@@ -0,0 +1,80 @@
+"""Add organization_unit_closure
+
+Revision ID: aafda830c585
+Revises: e565c0452c62
+Create Date: 2026-10-18 09:12:41.318274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'aafda830c585'
+down_revision: Union[str, None] = 'e565c0452c62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'organization_unit_closure',
+        sa.Column('ancestor_id', sa.Integer(), nullable=False),
+        sa.Column('descendant_id', sa.Integer(), nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['ancestor_id'], ['organization_units.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['descendant_id'], ['organization_units.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    op.create_index(
+        op.f('ix_organization_unit_closure_descendant_id'),
+        'organization_unit_closure',
+        ['descendant_id'],
+        unique=False
+    )
+
+    # A parent_unit_id cycle would make the backfill below recurse forever,
+    # so walk up from every unit, carrying the path, and stop on the first repeat
+    op.execute("""
+        DO $$
+        DECLARE
+            cycle_unit_id integer;
+        BEGIN
+            WITH RECURSIVE walk(unit_id, parent_unit_id, path, is_cycle) AS (
+                SELECT id, parent_unit_id, ARRAY[id], false
+                FROM organization_units
+                WHERE parent_unit_id IS NOT NULL
+                UNION ALL
+                SELECT walk.unit_id, parent.parent_unit_id, walk.path || parent.id, parent.id = ANY(walk.path)
+                FROM walk
+                JOIN organization_units parent ON parent.id = walk.parent_unit_id
+                WHERE NOT walk.is_cycle
+            )
+            SELECT unit_id INTO cycle_unit_id FROM walk WHERE is_cycle ORDER BY unit_id LIMIT 1;
+
+            IF cycle_unit_id IS NOT NULL THEN
+                RAISE EXCEPTION 'organization_units.parent_unit_id forms a cycle through unit %; fix the parent links and rerun the migration', cycle_unit_id;
+            END IF;
+        END
+        $$
+    """)
+
+    # Backfill from the existing parent_unit_id links
+    op.execute("""
+        WITH RECURSIVE tree(ancestor_id, descendant_id, depth) AS (
+            SELECT id, id, 0 FROM organization_units
+            UNION ALL
+            SELECT tree.ancestor_id, child.id, tree.depth + 1
+            FROM tree
+            JOIN organization_units child ON child.parent_unit_id = tree.descendant_id
+        )
+        INSERT INTO organization_unit_closure (ancestor_id, descendant_id, depth)
+        SELECT ancestor_id, descendant_id, depth FROM tree
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_organization_unit_closure_descendant_id'), table_name='organization_unit_closure')
+    op.drop_table('organization_unit_closure')
@@ -0,0 +1,102 @@
+"""Create base tables
+
+Revision ID: b2b87dec0ba0
+Revises:
+Create Date: 2024-12-30 15:48:12.524907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2b87dec0ba0'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The tables as the service created them with Base.metadata.create_all before
+# Alembic was introduced; e565c0452c62 and later revisions build on them.
+# Databases created that way are already past this revision.
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('birthday', sa.Date(), nullable=True),
+        sa.Column('email', sa.String(), nullable=True),
+        sa.Column('mobile_number', sa.String(), nullable=True),
+        sa.Column('level', sa.String(), nullable=True),
+        sa.Column('role', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_users_id'), 'users', ['id'], unique=False)
+    op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+
+    op.create_table(
+        'organization_categories',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('category_name', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_organization_categories_id'), 'organization_categories', ['id'], unique=False)
+
+    op.create_table(
+        'organization_units',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('unit_name', sa.String(), nullable=True),
+        sa.Column('category_id', sa.Integer(), nullable=True),
+        sa.Column('parent_unit_id', sa.Integer(), nullable=True),
+        sa.Column('leader_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_organization_units_id'), 'organization_units', ['id'], unique=False)
+
+    op.create_table(
+        'user_organization_units',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('unit_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_user_organization_units_id'), 'user_organization_units', ['id'], unique=False)
+
+    # meeting_date, NOT NULL and the user_id foreign key are added by e565c0452c62.
+    # meeting_type is created as the enum it converts to, since Postgres cannot
+    # cast a VARCHAR column to an enum without USING.
+    op.create_table(
+        'meeting_attendance',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('meeting_type', sa.Enum('SUNDAY_SERVICE', 'GROUP_MEETING', name='meetingtype'), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_meeting_attendance_id'), 'meeting_attendance', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_meeting_attendance_id'), table_name='meeting_attendance')
+    op.drop_table('meeting_attendance')
+    sa.Enum(name='meetingtype').drop(op.get_bind(), checkfirst=True)
+    op.drop_index(op.f('ix_user_organization_units_id'), table_name='user_organization_units')
+    op.drop_table('user_organization_units')
+    op.drop_index(op.f('ix_organization_units_id'), table_name='organization_units')
+    op.drop_table('organization_units')
+    op.drop_index(op.f('ix_organization_categories_id'), table_name='organization_categories')
+    op.drop_table('organization_categories')
+    op.drop_index(op.f('ix_users_email'), table_name='users')
+    op.drop_index(op.f('ix_users_id'), table_name='users')
+    op.drop_table('users')
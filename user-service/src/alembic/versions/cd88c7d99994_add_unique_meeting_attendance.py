@@ -0,0 +1,38 @@
+"""Add unique (user_id, meeting_type, meeting_date) to meeting_attendance
+
+Revision ID: cd88c7d99994
+Revises: aafda830c585
+Create Date: 2026-10-18 10:41:07.552190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'cd88c7d99994'
+down_revision: Union[str, None] = 'aafda830c585'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Remove duplicate records, keeping the earliest one of each group
+    op.execute("""
+        DELETE FROM meeting_attendance a
+        USING meeting_attendance b
+        WHERE a.user_id = b.user_id
+          AND a.meeting_type = b.meeting_type
+          AND a.meeting_date = b.meeting_date
+          AND a.id > b.id
+    """)
+    op.create_unique_constraint(
+        'uq_meeting_attendance_user_type_date',
+        'meeting_attendance',
+        ['user_id', 'meeting_type', 'meeting_date']
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_meeting_attendance_user_type_date', 'meeting_attendance', type_='unique')
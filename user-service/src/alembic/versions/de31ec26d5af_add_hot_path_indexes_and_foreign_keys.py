@@ -0,0 +1,70 @@
+"""Add hot path indexes and foreign keys
+
+Revision ID: de31ec26d5af
+Revises: 689354d5c18a
+Create Date: 2026-10-18 13:05:19.640827
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'de31ec26d5af'
+down_revision: Union[str, None] = '689354d5c18a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_organization_units_parent_unit_id', 'organization_units', ['parent_unit_id']),
+    ('ix_organization_units_category_id', 'organization_units', ['category_id']),
+    ('ix_user_organization_units_unit_id', 'user_organization_units', ['unit_id']),
+    ('ix_meeting_attendance_user_id_meeting_date', 'meeting_attendance', ['user_id', 'meeting_date']),
+    ('ix_meeting_attendance_meeting_date', 'meeting_attendance', ['meeting_date']),
+]
+
+# (name, source table, column, referent table, ondelete)
+FOREIGN_KEYS = [
+    ('organization_units_category_id_fkey', 'organization_units', 'category_id', 'organization_categories', None),
+    ('organization_units_parent_unit_id_fkey', 'organization_units', 'parent_unit_id', 'organization_units', None),
+    ('organization_units_leader_id_fkey', 'organization_units', 'leader_id', 'users', 'SET NULL'),
+    ('user_organization_units_user_id_fkey', 'user_organization_units', 'user_id', 'users', 'CASCADE'),
+    ('user_organization_units_unit_id_fkey', 'user_organization_units', 'unit_id', 'organization_units', 'CASCADE'),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+    # Remove duplicate memberships, keeping the earliest one
+    op.execute("""
+        DELETE FROM user_organization_units a
+        USING user_organization_units b
+        WHERE a.user_id = b.user_id
+          AND a.unit_id = b.unit_id
+          AND a.id > b.id
+    """)
+    op.create_unique_constraint(
+        'uq_user_organization_units_user_unit',
+        'user_organization_units',
+        ['user_id', 'unit_id']
+    )
+
+    # NOT VALID enforces the keys for new writes without failing on legacy orphans
+    # or scanning the tables under lock; run VALIDATE CONSTRAINT once they are cleaned
+    for name, table, column, referent, ondelete in FOREIGN_KEYS:
+        op.create_foreign_key(
+            name, table, referent, [column], ['id'],
+            ondelete=ondelete,
+            postgresql_not_valid=True
+        )
+
+
+def downgrade() -> None:
+    for name, table, column, referent, ondelete in reversed(FOREIGN_KEYS):
+        op.drop_constraint(name, table, type_='foreignkey')
+    op.drop_constraint('uq_user_organization_units_user_unit', 'user_organization_units', type_='unique')
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -1,7 +1,7 @@
 """Add meeting_date to meeting_attendance
 
 Revision ID: e565c0452c62
-Revises: 
+Revises: b2b87dec0ba0
 Create Date: 2024-12-30 16:02:01.101263
 
 """
@@ -13,7 +13,7 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision: str = 'e565c0452c62'
-down_revision: Union[str, None] = None
+down_revision: Union[str, None] = 'b2b87dec0ba0'
 branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
@@ -52,7 +52,7 @@ def downgrade() -> None:
     op.alter_column('users', 'name',
                existing_type=sa.VARCHAR(),
                nullable=True)
-    op.drop_constraint(None, 'meeting_attendance', type_='foreignkey')
+    op.drop_constraint('meeting_attendance_user_id_fkey', 'meeting_attendance', type_='foreignkey')
     op.alter_column('meeting_attendance', 'meeting_type',
                existing_type=sa.Enum('SUNDAY_SERVICE', 'GROUP_MEETING', name='meetingtype'),
                type_=sa.VARCHAR(),
@@ -0,0 +1,42 @@
+"""
+Helpers for the multi-ID batch endpoints
+
+IDs are given as ?ids=3,1,2 (or repeated ?ids=). Each distinct ID is looked up
+once; the found rows are kept in a dict for the request, so repeated IDs are
+served from it and the items follow the request order.
+"""
+from typing import Any, Dict, List, Sequence
+
+MAX_BATCH_IDS = 500
+
+
+def parse_ids(values: Sequence[str]) -> List[int]:
+    """
+    Parse the ids query parameter into IDs in request order, repeats included
+
+    Raises:
+        ValueError: If an ID is not an integer or more than MAX_BATCH_IDS are given
+    """
+    ids = [int(part) for value in values for part in value.split(",") if part.strip()]
+    if not ids:
+        raise ValueError("No IDs given")
+    if len(ids) > MAX_BATCH_IDS:
+        raise ValueError(f"At most {MAX_BATCH_IDS} IDs per request")
+    return ids
+
+
+def batch_body(ids: Sequence[int], found: Dict[int, Any]) -> dict:
+    """
+    Build a BatchResponse body
+
+    Args:
+        ids: Requested IDs in request order
+        found: The rows that exist, by ID
+
+    Returns:
+        dict: items in request order and the missing IDs, each listed once
+    """
+    return {
+        "items": [found[item_id] for item_id in ids if item_id in found],
+        "missing": list(dict.fromkeys(item_id for item_id in ids if item_id not in found)),
+    }
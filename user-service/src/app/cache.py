@@ -0,0 +1,188 @@
+"""
+Redis cache for GET responses, with strong ETags and 304 Not Modified
+
+Mark an endpoint as cacheable with the tags of the tables it reads:
+
+    @router.get("/organization-units/by-category/{category_id}")
+    @cached_response("organization_units")
+    async def read_organization_units_by_category(...): ...
+
+and call invalidate_cache_tags(...) after committing a write to any of them.
+Endpoints with a query parameter that defaults to today's date list it in
+today_params, so the date an omitted parameter resolves to is part of the key.
+Each tag has a version counter in Redis that is part of the cache key, so
+invalidating a tag makes all of its entries unreachable; they expire by TTL.
+
+With read replicas, a response read during the sticky window after a write may
+come from a replica that has not replayed it yet, so it is served but not stored.
+"""
+from dataclasses import dataclass
+from datetime import date
+import hashlib
+import logging
+from typing import Optional, Tuple
+import redis
+from fastapi import Request, Response
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.routing import BaseRoute, Match
+from app.core.config import settings
+from app.core.redis import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = "response_cache"
+TAG_VERSION_PREFIX = "response_cache:tag"
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    tags: Tuple[str, ...]
+    ttl: int
+    today_params: Tuple[str, ...] = ()
+
+
+def cached_response(*tags: str, ttl: Optional[int] = None, today_params: Tuple[str, ...] = ()):
+    """
+    Mark a GET endpoint's responses as cacheable
+
+    Must be applied below the router decorator, so the router registers the
+    marked function.
+
+    Args:
+        tags: Names of the tables the response is built from
+        ttl: Lifetime of an entry in seconds, RESPONSE_CACHE_TTL_SECONDS if None
+        today_params: Query parameters that default to today's date
+    """
+    def decorator(endpoint):
+        endpoint.cache_policy = CachePolicy(
+            tuple(sorted(tags)),
+            ttl or settings.RESPONSE_CACHE_TTL_SECONDS,
+            tuple(today_params)
+        )
+        return endpoint
+    return decorator
+
+
+def _tag_version_key(tag: str) -> str:
+    return f"{TAG_VERSION_PREFIX}:{tag}"
+
+
+def _tag_written_key(tag: str) -> str:
+    # Exists during the replica sticky window after a write to the tag
+    return f"{TAG_VERSION_PREFIX}:{tag}:written"
+
+
+def invalidate_cache_tags(*tags: str) -> None:
+    """
+    Invalidate every cached response built from the given tables
+
+    Call after committing a write to any of them.
+    """
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for tag in tags:
+            pipe.incr(_tag_version_key(tag))
+            if settings.DATABASE_REPLICA_URLS:
+                pipe.set(_tag_written_key(tag), 1, ex=settings.DB_REPLICA_STICKY_SECONDS)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to invalidate response cache tags {tags}: {str(e)}")
+
+
+def _find_route(request: Request) -> Optional[BaseRoute]:
+    # Same first-full-match rule as the router
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route
+    return None
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"})
+
+
+class ResponseCacheMiddleware(BaseHTTPMiddleware):
+    """
+    Serve marked GET endpoints from Redis and answer If-None-Match with 304
+
+    Any Redis failure falls back to running the endpoint uncached.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        if request.method != "GET":
+            return await call_next(request)
+        route = _find_route(request)
+        policy = getattr(getattr(route, "endpoint", None), "cache_policy", None)
+        if policy is None:
+            return await call_next(request)
+        # Hits and 304s never reach the router, which sets the route for the
+        # request metrics otherwise
+        request.scope["route"] = route
+
+        client = get_async_redis()
+        key = None
+        recently_written = False
+        try:
+            # Read the tag versions before running the endpoint, so a write
+            # committed meanwhile leaves the stored entry unreachable
+            keys = [_tag_version_key(tag) for tag in policy.tags]
+            if settings.DATABASE_REPLICA_URLS:
+                keys += [_tag_written_key(tag) for tag in policy.tags]
+            values = await client.mget(keys)
+            versions = values[:len(policy.tags)]
+            recently_written = any(values[len(policy.tags):])
+            key = self._cache_key(request, policy, versions)
+            cached = await client.hgetall(key)
+        except redis.RedisError as e:
+            logger.warning(f"Response cache unavailable: {str(e)}")
+            cached = None
+
+        if cached:
+            etag = cached[b"etag"].decode()
+            if _etag_matches(request, etag):
+                return _not_modified(etag)
+            return Response(
+                content=cached[b"body"],
+                media_type=cached[b"content_type"].decode(),
+                headers={"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept", "X-Cache": "HIT"}
+            )
+
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        etag = '"' + hashlib.sha256(body).hexdigest() + '"'
+        content_type = response.headers.get("content-type", "application/json")
+        if key is not None and not recently_written:
+            try:
+                pipe = client.pipeline(transaction=False)
+                pipe.hset(key, mapping={"body": body, "etag": etag, "content_type": content_type})
+                pipe.expire(key, policy.ttl)
+                await pipe.execute()
+            except redis.RedisError as e:
+                logger.warning(f"Failed to store cached response: {str(e)}")
+
+        if _etag_matches(request, etag):
+            return _not_modified(etag)
+        headers = dict(response.headers)
+        headers.update({"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept", "X-Cache": "MISS"})
+        return Response(content=body, status_code=response.status_code, headers=headers)
+
+    @staticmethod
+    def _cache_key(request: Request, policy: CachePolicy, versions) -> str:
+        params = "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items()))
+        # A response for "this week" must not be served once the day changes
+        if any(name not in request.query_params for name in policy.today_params):
+            params += f"&today={date.today().isoformat()}"
+        versions = ",".join((version or b"0").decode() for version in versions)
+        material = "\n".join([request.url.path, params, request.headers.get("accept", ""), versions])
+        return f"{CACHE_KEY_PREFIX}:{hashlib.sha256(material.encode()).hexdigest()}"
@@ -0,0 +1,39 @@
+import redis
+import redis.asyncio
+from app.core.config import settings
+
+_client = None
+_async_client = None
+
+def get_redis() -> redis.Redis:
+    """
+    Get the process-wide Redis client
+
+    The client is created lazily so that importing the app never needs a
+    running Redis; connections are opened on first use.
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT
+        )
+    return _client
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """
+    Get the process-wide asyncio Redis client
+
+    Unlike get_redis, replies are returned as bytes so binary values can be stored.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = redis.asyncio.Redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT
+        )
+    return _async_client
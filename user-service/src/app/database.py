@@ -1,16 +1,156 @@
+import multiprocessing
+import random
+import time
+from typing import Optional, Tuple
+from uuid import uuid4
+from fastapi import Request, Response
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from app.core.config import settings
+from app.metrics import TimedAsyncAdaptedQueuePool, TimedQueuePool, instrument_engine, instrument_pool
+from app.query_budget import track_engine
 
-engine = create_engine(settings.DATABASE_URL)
+def async_database_url(url: str, async_url: Optional[str] = None) -> str:
+    """
+    Get the asyncpg URL for a database, derived from its sync URL unless given
+    """
+    if async_url:
+        return async_url
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+def pool_limits() -> Tuple[int, int]:
+    """
+    Get the pool size and max overflow of each engine in this worker process
+
+    Unless set explicitly, they split DB_MAX_CONNECTIONS evenly over the workers
+    and their two engines. With 4 workers and the default of 90, each engine
+    keeps 5 connections open and may open 6 more, 88 connections at most.
+    """
+    workers = settings.WEB_CONCURRENCY or multiprocessing.cpu_count()
+    per_engine = max(2, settings.DB_MAX_CONNECTIONS // (workers * 2))
+    pool_size = settings.DB_POOL_SIZE if settings.DB_POOL_SIZE is not None else per_engine // 2
+    max_overflow = settings.DB_MAX_OVERFLOW if settings.DB_MAX_OVERFLOW is not None else per_engine - pool_size
+    return pool_size, max_overflow
+
+def engine_options(async_driver: bool = False) -> dict:
+    """
+    Get the pool and driver options of an engine from the settings
+
+    Args:
+        async_driver: Options for the asyncpg engine
+    """
+    if settings.DB_PGBOUNCER:
+        # PgBouncer already pools the server connections, and in transaction mode
+        # consecutive statements may run on different ones, so asyncpg must not
+        # cache prepared statements or reuse their names
+        options = {"poolclass": NullPool}
+        if async_driver:
+            options["connect_args"] = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+            }
+        return options
+
+    pool_size, max_overflow = pool_limits()
+    return {
+        "poolclass": TimedAsyncAdaptedQueuePool if async_driver else TimedQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+
+engine = create_engine(settings.DATABASE_URL, **engine_options())
+instrument_engine(engine)
+track_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine for the async def routes, so queries do not block the event loop
+async_engine = create_async_engine(
+    async_database_url(settings.DATABASE_URL, settings.ASYNC_DATABASE_URL),
+    **engine_options(async_driver=True)
+)
+instrument_engine(async_engine.sync_engine)
+track_engine(async_engine.sync_engine)
+
+if not settings.DB_PGBOUNCER:
+    instrument_pool(engine, "sync")
+    instrument_pool(async_engine.sync_engine, "async")
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# 唯讀副本：GET 請求由副本讀取，其餘請求及背景工作（組織樹、統計彙總）使用主庫
+ReplicaSessionLocals = []
+AsyncReplicaSessionLocals = []
+for index, replica_url in enumerate(settings.DATABASE_REPLICA_URLS):
+    replica_engine = create_engine(replica_url, **engine_options())
+    async_replica_engine = create_async_engine(async_database_url(replica_url), **engine_options(async_driver=True))
+    for name, instrumented in ((f"sync-replica{index}", replica_engine), (f"async-replica{index}", async_replica_engine.sync_engine)):
+        instrument_engine(instrumented)
+        track_engine(instrumented)
+        if not settings.DB_PGBOUNCER:
+            instrument_pool(instrumented, name)
+    ReplicaSessionLocals.append(sessionmaker(autocommit=False, autoflush=False, bind=replica_engine))
+    AsyncReplicaSessionLocals.append(async_sessionmaker(async_replica_engine, autoflush=False, expire_on_commit=False))
+
+READ_METHODS = {"GET", "HEAD"}
+
+# Unix time until which the client reads from the primary, set after its writes
+PRIMARY_COOKIE = "db_primary_until"
+
+def reads_from_primary(request: Request) -> bool:
+    """
+    Check whether a request must use the primary database
+
+    Writes always do, and so do the reads of a client during the sticky
+    window after its last write, so it sees its own changes despite the
+    replication lag.
+    """
+    if not settings.DATABASE_REPLICA_URLS or request.method not in READ_METHODS:
+        return True
+    try:
+        return float(request.cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def mark_primary_reads(request: Request, response: Response) -> None:
+    """Start the sticky window after a successful write by the client"""
+    if settings.DATABASE_REPLICA_URLS and request.method not in READ_METHODS and response.status_code < 400:
+        response.set_cookie(
+            PRIMARY_COOKIE,
+            str(time.time() + settings.DB_REPLICA_STICKY_SECONDS),
+            max_age=settings.DB_REPLICA_STICKY_SECONDS,
+            httponly=True,
+            samesite="lax"
+        )
+
+def session_factory(request: Request) -> sessionmaker:
+    """Get the sessionmaker of the database a request reads from"""
+    if reads_from_primary(request):
+        return SessionLocal
+    return random.choice(ReplicaSessionLocals)
+
 Base = declarative_base()
 
-# 依賴注入
-def get_db():
-    db = SessionLocal()
+# 依賴注入：GET 請求取得副本 session，其餘取得主庫 session
+def get_db(request: Request):
+    db = session_factory(request)()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db(request: Request):
+    if reads_from_primary(request):
+        db = AsyncSessionLocal()
+    else:
+        db = random.choice(AsyncReplicaSessionLocals)()
+    try:
+        yield db
+    finally:
+        await db.close()
@@ -0,0 +1,165 @@
+from typing import Dict, List, Optional
+from sqlalchemy import delete, insert, literal, select, true
+from sqlalchemy.orm import Session, aliased
+from . import models
+
+Closure = models.Organization_unit_closure
+Unit = models.Organization_units
+
+# Upper bound on the walk down from the roots
+MAX_HIERARCHY_DEPTH = 64
+
+
+def subtree_unit_ids_query(unit_id: int):
+    """
+    Build a SELECT of the IDs of a unit and all of its descendants
+
+    The result can be embedded as an IN subquery so that subtree filters are
+    resolved by the database in the same round trip. Request handlers resolve
+    subtrees from the cached OrgTree instead; the closure table serves the
+    closure maintenance here and the weekly rollups in app.rollup.
+    """
+    return select(Closure.descendant_id).where(Closure.ancestor_id == unit_id)
+
+
+def add_unit_to_closure(db: Session, unit_id: int, parent_unit_id: Optional[int]) -> None:
+    """
+    Insert the closure rows of a newly created unit
+
+    The unit becomes a descendant of every ancestor of its parent (and of the
+    parent itself), plus the depth-0 row pointing to itself.
+    """
+    db.execute(insert(Closure).values(ancestor_id=unit_id, descendant_id=unit_id, depth=0))
+    if parent_unit_id is None:
+        return
+
+    db.execute(
+        insert(Closure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(Closure.ancestor_id, literal(unit_id), Closure.depth + 1)
+            .where(Closure.descendant_id == parent_unit_id)
+        )
+    )
+
+
+def move_unit_in_closure(db: Session, unit_id: int, new_parent_unit_id: Optional[int]) -> None:
+    """
+    Re-attach a unit and its whole subtree under a new parent
+
+    Args:
+        db: Database session
+        unit_id: ID of the unit being moved
+        new_parent_unit_id: ID of the new parent, or None to make it a root
+
+    Raises:
+        ValueError: If the new parent is the unit itself or one of its descendants
+    """
+    subtree = subtree_unit_ids_query(unit_id)
+
+    if new_parent_unit_id is not None:
+        is_descendant = db.execute(
+            select(Closure.descendant_id).where(
+                Closure.ancestor_id == unit_id,
+                Closure.descendant_id == new_parent_unit_id
+            )
+        ).first()
+        if is_descendant:
+            raise ValueError("Cannot move a unit under itself or one of its sub-units")
+
+    # Detach the subtree from its old ancestors, keeping its internal paths
+    db.execute(
+        delete(Closure).where(
+            Closure.descendant_id.in_(subtree),
+            Closure.ancestor_id.not_in(subtree)
+        )
+    )
+
+    if new_parent_unit_id is None:
+        return
+
+    # Connect every ancestor of the new parent to every node in the subtree
+    super_tree = aliased(Closure)
+    sub_tree = aliased(Closure)
+    db.execute(
+        insert(Closure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(
+                super_tree.ancestor_id,
+                sub_tree.descendant_id,
+                super_tree.depth + sub_tree.depth + 1
+            ).join(sub_tree, true()).where(
+                super_tree.descendant_id == new_parent_unit_id,
+                sub_tree.ancestor_id == unit_id
+            )
+        )
+    )
+
+
+def get_hierarchy_rows(db: Session):
+    """
+    Fetch every unit with one WITH RECURSIVE query, parents before children
+
+    The recursive part walks down from the root units and numbers their depth.
+    Units it cannot reach, such as those on a parent_unit_id cycle in legacy
+    data, come last with a NULL depth.
+    """
+    tree = select(
+        Unit.id,
+        literal(0).label("depth")
+    ).where(Unit.parent_unit_id.is_(None)).cte("tree", recursive=True)
+
+    child = aliased(Unit)
+    tree = tree.union_all(
+        select(
+            child.id,
+            tree.c.depth + 1
+        ).join(tree, child.parent_unit_id == tree.c.id)
+        .where(tree.c.depth < MAX_HIERARCHY_DEPTH)
+    )
+
+    return db.execute(
+        select(
+            Unit.id,
+            Unit.unit_name,
+            Unit.category_id,
+            Unit.parent_unit_id,
+            Unit.leader_id,
+            Unit.created_at,
+            Unit.updated_at,
+            tree.c.depth
+        ).outerjoin(tree, tree.c.id == Unit.id)
+        .order_by(tree.c.depth.asc().nulls_last(), Unit.id)
+    ).all()
+
+
+def build_hierarchy(rows) -> List[dict]:
+    """
+    Assemble depth-ordered unit rows into the nested hierarchy dict in one pass
+
+    Args:
+        rows: Rows or nodes with id, unit_name, category_id, leader_id and
+            parent_unit_id, parents before children
+
+    Returns:
+        List[dict]: Root nodes, each with its nested "children"
+    """
+    nodes: Dict[int, dict] = {}
+    roots: List[dict] = []
+
+    for row in rows:
+        node = {
+            "id": row.id,
+            "name": row.unit_name,
+            "category_id": row.category_id,
+            "leader_id": row.leader_id,
+            "children": []
+        }
+        nodes[row.id] = node
+
+        if row.parent_unit_id is None:
+            roots.append(node)
+        else:
+            nodes[row.parent_unit_id]["children"].append(node)
+
+    return roots
+
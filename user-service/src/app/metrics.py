@@ -0,0 +1,166 @@
+"""
+Request latency, SQL query and connection pool instrumentation
+
+Every request gets a RequestStats in a context variable. The engine hooks add
+each query's time to it, and the timed pools add the time spent waiting for a
+connection. At the end of the request the totals are observed in per-route
+Prometheus histograms and sent as a Server-Timing header.
+
+The metrics are not served on the app port. The gunicorn master serves them on
+METRICS_PORT (see gunicorn.conf.py), aggregating every worker through the
+shared PROMETHEUS_MULTIPROC_DIR.
+"""
+from contextvars import ContextVar
+from dataclasses import dataclass
+import time
+from typing import Optional
+from prometheus_client import Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.pool.base import Pool
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Request latency per route",
+    ["method", "route", "status"]
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "SQL queries issued per request",
+    ["method", "route"],
+    buckets=QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent executing SQL per request",
+    ["method", "route"]
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+WORKER_STARTUP = Histogram(
+    "worker_startup_seconds",
+    "Time from importing the app to serving requests, per worker process",
+    buckets=(0.25, 0.5, 1, 2, 3, 5, 10, 30, 60)
+)
+
+# Live pool state, summed over the worker processes
+POOL_SIZE = Gauge("db_pool_size", "Configured pool size", ["engine"], multiprocess_mode="livesum")
+POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections in use", ["engine"], multiprocess_mode="livesum")
+POOL_IDLE = Gauge("db_pool_idle", "Idle connections in the pool", ["engine"], multiprocess_mode="livesum")
+POOL_OVERFLOW = Gauge("db_pool_overflow", "Connections opened beyond the pool size", ["engine"], multiprocess_mode="livesum")
+
+
+@dataclass
+class RequestStats:
+    query_count: int = 0
+    db_seconds: float = 0.0
+    pool_wait_seconds: float = 0.0
+
+
+# The object is shared with the threads and tasks the request runs in,
+# which get a copy of the context
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def start_request():
+    """Start collecting stats for the current request; returns a token for end_request"""
+    return _request_stats.set(RequestStats())
+
+
+def end_request(token, method: str, route: str, status: int, seconds: float) -> RequestStats:
+    """
+    Observe the request in the per-route histograms and stop collecting
+
+    Returns:
+        RequestStats: The totals of the request
+    """
+    stats = _request_stats.get()
+    _request_stats.reset(token)
+    REQUEST_LATENCY.labels(method, route, str(status)).observe(seconds)
+    REQUEST_QUERIES.labels(method, route).observe(stats.query_count)
+    REQUEST_DB_TIME.labels(method, route).observe(stats.db_seconds)
+    return stats
+
+
+def server_timing(stats: RequestStats, seconds: float) -> str:
+    """Format the totals of a request as a Server-Timing header value"""
+    return (
+        f"app;dur={seconds * 1000:.1f}, "
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.query_count} queries", '
+        f"pool;dur={stats.pool_wait_seconds * 1000:.1f}"
+    )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_start_time
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.query_count += 1
+        stats.db_seconds += elapsed
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Count and time every query of a (sync) engine; use async_engine.sync_engine for async engines"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def instrument_pool(engine: Engine, name: str) -> None:
+    """
+    Keep the pool gauges of an engine up to date on every checkout and checkin
+
+    Args:
+        engine: A sync engine with a QueuePool; use async_engine.sync_engine for async engines
+        name: Value of the "engine" label
+    """
+    pool: Pool = engine.pool
+
+    def update(*args):
+        POOL_SIZE.labels(name).set(pool.size())
+        POOL_CHECKED_OUT.labels(name).set(pool.checkedout())
+        POOL_IDLE.labels(name).set(pool.checkedin())
+        POOL_OVERFLOW.labels(name).set(max(pool.overflow(), 0))
+
+    for event_name in ("connect", "checkout", "checkin", "close"):
+        event.listen(engine, event_name, update)
+    update()
+
+
+def _record_pool_wait(seconds: float) -> None:
+    POOL_CHECKOUT_WAIT.observe(seconds)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.pool_wait_seconds += seconds
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            _record_pool_wait(time.perf_counter() - start)
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long each checkout waited"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            _record_pool_wait(time.perf_counter() - start)
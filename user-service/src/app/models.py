@@ -1,10 +1,17 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, Date, DateTime, Enum
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Date, DateTime, Enum, UniqueConstraint
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.sql import func
 from .database import Base
 from . import schemas
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Trigram indexes for /users/search
+        Index("ix_users_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_users_email_trgm", "email", postgresql_using="gin", postgresql_ops={"email": "gin_trgm_ops"}),
+        Index("ix_users_mobile_number_trgm", "mobile_number", postgresql_using="gin", postgresql_ops={"mobile_number": "gin_trgm_ops"}),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
@@ -29,26 +36,65 @@ class Organization_units(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     unit_name = Column(String)
-    category_id = Column(Integer)
-    parent_unit_id = Column(Integer)
-    leader_id = Column(Integer)
+    category_id = Column(Integer, ForeignKey("organization_categories.id"), index=True)
+    parent_unit_id = Column(Integer, ForeignKey("organization_units.id"), index=True)
+    leader_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+class Organization_unit_closure(Base):
+    """
+    Closure table of Organization_units: one row per (ancestor, descendant) pair,
+    including the depth-0 row of every unit to itself.
+    """
+    __tablename__ = "organization_unit_closure"
+
+    ancestor_id = Column(Integer, ForeignKey("organization_units.id", ondelete="CASCADE"), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey("organization_units.id", ondelete="CASCADE"), primary_key=True, index=True)
+    depth = Column(Integer, nullable=False)
+
 class User_organization_units(Base):
     __tablename__ = "user_organization_units"
+    __table_args__ = (
+        # Also serves the lookups by user_id
+        UniqueConstraint("user_id", "unit_id", name="uq_user_organization_units_user_unit"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer)
-    unit_id = Column(Integer)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    unit_id = Column(Integer, ForeignKey("organization_units.id", ondelete="CASCADE"), index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 class Meeting_attendance(Base):
     __tablename__ = "meeting_attendance"
+    __table_args__ = (
+        UniqueConstraint("user_id", "meeting_type", "meeting_date", name="uq_meeting_attendance_user_type_date"),
+        Index("ix_meeting_attendance_user_id_meeting_date", "user_id", "meeting_date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     meeting_type = Column(Enum(schemas.MeetingType), nullable=False)
-    meeting_date = Column(Date, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    meeting_date = Column(Date, nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Unit_weekly_attendance_summary(Base):
+    """
+    Weekly attendance rollup of a unit's whole subtree, per meeting type and level
+
+    The attendee arrays are parallel and ordered by each attendee's first
+    attendance record of the week.
+    """
+    __tablename__ = "unit_weekly_attendance_summary"
+
+    unit_id = Column(Integer, ForeignKey("organization_units.id", ondelete="CASCADE"), primary_key=True)
+    week_start = Column(Date, primary_key=True)
+    meeting_type = Column(Enum(schemas.MeetingType), primary_key=True)
+    level = Column(String, primary_key=True)
+    attendance_count = Column(Integer, nullable=False)
+    attendee_count = Column(Integer, nullable=False)
+    attendee_ids = Column(ARRAY(Integer), nullable=False)
+    first_record_ids = Column(ARRAY(Integer), nullable=False)
+    record_counts = Column(ARRAY(Integer), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,294 @@
+from dataclasses import dataclass
+from datetime import datetime
+import logging
+import os
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, List, Optional
+import redis
+from starlette.concurrency import run_in_threadpool
+from .core.config import settings
+from .core.redis import get_redis
+from .database import SessionLocal
+from .hierarchy import build_hierarchy, get_hierarchy_rows
+
+logger = logging.getLogger(__name__)
+
+ORG_TREE_VERSION_KEY = "org_tree:version"
+ORG_TREE_CHANNEL = "org_tree:invalidate"
+
+
+@dataclass(frozen=True)
+class UnitNode:
+    """Immutable snapshot of an Organization_units row"""
+    id: int
+    unit_name: Optional[str]
+    category_id: Optional[int]
+    parent_unit_id: Optional[int]
+    leader_id: Optional[int]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+
+class OrgTree:
+    """
+    In-memory snapshot of the whole organization structure
+
+    Built from one query and shared by every request of the process until an
+    Organization_units write invalidates it. The units are expected parents
+    before children, as get_hierarchy_rows returns them; units that cannot be
+    reached from a root are kept but left out of the hierarchy.
+    """
+
+    def __init__(self, units: Iterable[UnitNode]):
+        units = list(units)
+        self.units: Dict[int, UnitNode] = {}
+        self.children: Dict[Optional[int], List[UnitNode]] = {}
+        self.categories: Dict[int, List[UnitNode]] = {}
+
+        for unit in sorted(units, key=lambda u: u.id):
+            self.units[unit.id] = unit
+            self.children.setdefault(unit.parent_unit_id, []).append(unit)
+            self.categories.setdefault(unit.category_id, []).append(unit)
+
+        # Units reachable from the roots, in the given parents-first order
+        self.ordered: List[UnitNode] = []
+        reachable = set()
+        for unit in units:
+            if unit.parent_unit_id is None or unit.parent_unit_id in reachable:
+                reachable.add(unit.id)
+                self.ordered.append(unit)
+
+        self.descendants: Dict[int, FrozenSet[int]] = self._build_descendants()
+        self._hierarchy = build_hierarchy(self.ordered)
+
+    def _build_descendants(self) -> Dict[int, FrozenSet[int]]:
+        descendants: Dict[int, FrozenSet[int]] = {}
+        visiting = set()
+
+        def collect(unit_id: int) -> FrozenSet[int]:
+            if unit_id in descendants:
+                return descendants[unit_id]
+            if unit_id in visiting:
+                # Cycle in legacy data, stop the walk here
+                return frozenset()
+            visiting.add(unit_id)
+            ids = {unit_id}
+            for child in self.children.get(unit_id, []):
+                ids.update(collect(child.id))
+            visiting.discard(unit_id)
+            descendants[unit_id] = frozenset(ids)
+            return descendants[unit_id]
+
+        for unit_id in self.units:
+            collect(unit_id)
+        return descendants
+
+    @classmethod
+    def load(cls, db) -> "OrgTree":
+        """
+        Build the tree from the database with a single WITH RECURSIVE query
+
+        Args:
+            db: Database session
+
+        Returns:
+            OrgTree: The loaded tree
+        """
+        rows = get_hierarchy_rows(db)
+
+        units = [
+            UnitNode(
+                id=row.id,
+                unit_name=row.unit_name,
+                category_id=row.category_id,
+                parent_unit_id=row.parent_unit_id,
+                leader_id=row.leader_id,
+                created_at=row.created_at,
+                updated_at=row.updated_at
+            )
+            for row in rows
+        ]
+        return cls(units)
+
+    def hierarchy(self) -> List[dict]:
+        """Get the nested hierarchy, same shape as /organization-units/hierarchy"""
+        return self._hierarchy
+
+    def get(self, unit_id: int) -> Optional[UnitNode]:
+        return self.units.get(unit_id)
+
+    def children_of(self, parent_unit_id: Optional[int]) -> List[UnitNode]:
+        return self.children.get(parent_unit_id, [])
+
+    def in_category(self, category_id: int) -> List[UnitNode]:
+        return self.categories.get(category_id, [])
+
+    def ancestors(self, unit_id: int) -> List[UnitNode]:
+        """Get a unit and its ancestors, ordered from the unit up to the root"""
+        chain = []
+        seen = set()
+        unit = self.units.get(unit_id)
+        while unit is not None and unit.id not in seen:
+            chain.append(unit)
+            seen.add(unit.id)
+            unit = self.units.get(unit.parent_unit_id)
+        return chain
+
+    def subtree_ids(self, unit_id: int) -> FrozenSet[int]:
+        """Get the IDs of a unit and all of its descendants, empty if unknown"""
+        return self.descendants.get(unit_id, frozenset())
+
+    def options(
+        self,
+        roots: Iterable[UnitNode],
+        members: Optional[Dict[int, List[dict]]] = None
+    ) -> List[dict]:
+        """
+        Build the nested option tree for the cascading unit selects
+
+        Args:
+            roots: Units at the top of the tree
+            members: Direct members per unit ID; members are left out if None
+
+        Returns:
+            List[dict]: id, unit_name, category_id and children per unit, plus members
+        """
+        def build(unit: UnitNode, path: frozenset) -> dict:
+            option = {
+                "id": unit.id,
+                "unit_name": unit.unit_name,
+                "category_id": unit.category_id,
+                # Skip children that would close a cycle in legacy data
+                "children": [
+                    build(child, path | {child.id})
+                    for child in self.children.get(unit.id, [])
+                    if child.id not in path
+                ]
+            }
+            if members is not None:
+                option["members"] = members.get(unit.id, [])
+            return option
+
+        return [build(unit, frozenset([unit.id])) for unit in roots]
+
+
+_tree: Optional[OrgTree] = None
+_tree_generation = -1
+_tree_built_at = 0.0
+_generation = 0
+_generation_lock = threading.Lock()
+_build_lock = threading.Lock()
+_listener_pid: Optional[int] = None
+
+
+def _bump_generation() -> None:
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+
+def _is_fresh(tree: Optional[OrgTree]) -> bool:
+    return (
+        tree is not None
+        and _tree_generation == _generation
+        and time.monotonic() - _tree_built_at < settings.ORG_TREE_MAX_AGE_SECONDS
+    )
+
+
+def _listen_for_invalidations() -> None:
+    """Drop the local tree whenever another worker publishes a version bump"""
+    reconnecting = False
+    while True:
+        try:
+            client = redis.Redis.from_url(
+                settings.REDIS_URL,
+                decode_responses=True,
+                socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                health_check_interval=30
+            )
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(ORG_TREE_CHANNEL)
+            if reconnecting:
+                # Messages may have been missed while disconnected
+                _bump_generation()
+            for message in pubsub.listen():
+                if message["type"] == "message":
+                    _bump_generation()
+        except Exception as e:
+            reconnecting = True
+            logger.warning(f"Org tree invalidation listener disconnected: {str(e)}")
+            time.sleep(5)
+
+
+def _ensure_listener() -> None:
+    # One listener per process, also after a fork into worker processes
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _generation_lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+    threading.Thread(target=_listen_for_invalidations, name="org-tree-listener", daemon=True).start()
+
+
+def get_org_tree() -> OrgTree:
+    """
+    Get the cached organization tree, rebuilding it if it is stale
+
+    The tree is always loaded from the primary database with its own session.
+
+    Returns:
+        OrgTree: The current organization tree
+    """
+    global _tree, _tree_generation, _tree_built_at
+    _ensure_listener()
+
+    tree = _tree
+    if _is_fresh(tree):
+        return tree
+
+    with _build_lock:
+        # Another thread may have rebuilt the tree while we were waiting
+        if _is_fresh(_tree):
+            return _tree
+
+        generation = _generation
+        db = SessionLocal()
+        try:
+            tree = OrgTree.load(db)
+        finally:
+            db.close()
+        # A concurrent invalidation leaves the new tree marked stale
+        _tree = tree
+        _tree_generation = generation
+        _tree_built_at = time.monotonic()
+        return tree
+
+
+async def aget_org_tree() -> OrgTree:
+    """
+    Async variant of get_org_tree for async def routes
+
+    A rebuild runs in the thread pool so it never blocks the event loop.
+    """
+    tree = _tree
+    if _listener_pid == os.getpid() and _is_fresh(tree):
+        return tree
+    return await run_in_threadpool(get_org_tree)
+
+
+def invalidate_org_tree() -> None:
+    """
+    Mark the organization tree stale in this and every other worker process
+
+    Call after committing any write that affects Organization_units.
+    """
+    _bump_generation()
+    try:
+        client = get_redis()
+        version = client.incr(ORG_TREE_VERSION_KEY)
+        client.publish(ORG_TREE_CHANNEL, version)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to publish org tree invalidation: {str(e)}")
@@ -0,0 +1,52 @@
+from typing import Optional, Sequence
+
+
+def apply_keyset(query, id_column, after: int, limit: int):
+    """
+    Restrict a query to the page of rows after a cursor
+
+    One extra row is fetched so keyset_page can tell whether a next page exists.
+
+    Args:
+        query: A Select or ORM Query
+        id_column: The unique, indexed column the cursor refers to
+        after: ID of the last row of the previous page
+        limit: Page size
+    """
+    return query.where(id_column > after).order_by(id_column).limit(limit + 1)
+
+
+def keyset_page(rows: Sequence, limit: int, total: Optional[int] = None) -> dict:
+    """
+    Build a PaginatedResponse body from rows fetched with apply_keyset
+
+    Args:
+        rows: Up to limit + 1 rows ordered by ID
+        limit: Page size
+        total: Optional total count of matching rows
+
+    Returns:
+        dict: items, total, skip, limit and next_cursor (None on the last page)
+    """
+    items = list(rows[:limit])
+    next_cursor = items[-1].id if len(rows) > limit and items else None
+    return {
+        "items": items,
+        "total": total,
+        "skip": 0,
+        "limit": limit,
+        "next_cursor": next_cursor
+    }
+
+
+def slice_after(items: Sequence, after: int, limit: int) -> list:
+    """
+    Keyset-slice an in-memory sequence that is ordered by ID, like apply_keyset
+    """
+    start = 0
+    for start, item in enumerate(items):
+        if item.id > after:
+            break
+    else:
+        return []
+    return list(items[start:start + limit + 1])
@@ -0,0 +1,154 @@
+"""
+Query budgets to catch N+1 query patterns
+
+Declare how many statements a route or block may issue:
+
+    @router.get("/organization-units/{unit_id}/members")
+    @max_queries(3)
+    async def get_unit_members(...): ...
+
+    with max_queries(2, engine=engine):
+        ...
+
+A budget is violated when more statements than declared are executed, or when
+one statement shape (the SQL with its parameters stripped) repeats more than
+max_repeats times, which is the signature of a query inside a loop. Violations
+raise QueryBudgetExceeded when strict (settings.DEBUG by default), otherwise
+they are logged.
+
+Statements are seen through the engines registered with track_engine, or the
+engine passed to max_queries, as in tests.
+"""
+from collections import Counter
+from contextvars import ContextVar
+import functools
+import inspect
+import logging
+import re
+from typing import List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_REPEATS = 3
+
+_PARAMETER = re.compile(r"%\(\w+\)s|\$\d+|:\w+|\?|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAMETER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def statement_shape(statement: str) -> str:
+    """Strip parameters and literals from a statement, collapsing IN lists of any length"""
+    shape = _PARAMETER.sub("?", statement)
+    shape = _PARAMETER_LIST.sub("?", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+_active_budgets: ContextVar[Tuple["max_queries", ...]] = ContextVar("active_query_budgets", default=())
+
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    for budget in _active_budgets.get():
+        if budget.engine is None or budget.engine is conn.engine:
+            budget.statements.append(statement)
+
+
+def track_engine(engine: Engine) -> None:
+    """Make the statements of an engine count against the active budgets"""
+    if not event.contains(engine, "before_cursor_execute", _record_statement):
+        event.listen(engine, "before_cursor_execute", _record_statement)
+
+
+class max_queries:
+    """
+    Limit the statements issued by a block or a (sync or async) function
+
+    Args:
+        limit: Maximum number of statements
+        max_repeats: Maximum executions of one statement shape
+        strict: Raise instead of logging, settings.DEBUG if None
+        engine: Only count this engine's statements, registering it if needed
+        name: Label used in the violation message
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        max_repeats: int = DEFAULT_MAX_REPEATS,
+        strict: Optional[bool] = None,
+        engine: Optional[Engine] = None,
+        name: Optional[str] = None
+    ):
+        self.limit = limit
+        self.max_repeats = max_repeats
+        self.strict = settings.DEBUG if strict is None else strict
+        self.engine = engine
+        self.name = name or "block"
+        self.statements: List[str] = []
+        self._tokens = []
+
+    def __enter__(self):
+        if self.engine is not None:
+            track_engine(self.engine)
+        self.statements = []
+        self._tokens.append(_active_budgets.set(_active_budgets.get() + (self,)))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _active_budgets.reset(self._tokens.pop())
+        # Do not mask the error the block already raised
+        if exc_type is None:
+            self.check()
+        return False
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def violations(self) -> List[str]:
+        problems = []
+        if self.count > self.limit:
+            problems.append(f"{self.count} queries, budget is {self.limit}")
+        for shape, repeats in Counter(map(statement_shape, self.statements)).most_common():
+            if repeats <= self.max_repeats:
+                break
+            problems.append(f"{repeats}x {shape}")
+        return problems
+
+    def check(self) -> None:
+        problems = self.violations()
+        if not problems:
+            return
+        message = f"Query budget of {self.name} exceeded: " + "; ".join(problems)
+        if self.strict:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+    def __call__(self, func):
+        # A fresh budget per call, so concurrent calls do not share statements
+        options = dict(
+            limit=self.limit,
+            max_repeats=self.max_repeats,
+            strict=self.strict,
+            engine=self.engine,
+            name=self.name if self.name != "block" else func.__qualname__
+        )
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with max_queries(**options):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with max_queries(**options):
+                return func(*args, **kwargs)
+        return wrapper
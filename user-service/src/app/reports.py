@@ -0,0 +1,226 @@
+from datetime import date, timedelta
+from typing import Iterable
+from sqlalchemy import Date, cast, func, literal_column, select, tuple_
+from sqlalchemy.orm import Session
+from . import models, schemas
+from .schemas import (
+    AttendanceCounts,
+    AttendanceStats,
+    AttendanceTrendPoint,
+    AttendanceTrendReport,
+    TrendGranularity,
+    WeeklyAttendanceReport,
+)
+
+# Upper bound on the points of one trend report, five years of weeks
+MAX_TREND_PERIODS = 260
+
+# Keyed by the stored level string
+LEVEL_COUNT_FIELDS = {
+    schemas.UserLevel.CHRISTIAN.value: "christian_count",
+    schemas.UserLevel.VIP.value: "vip_count",
+    schemas.UserLevel.NEW_FRIEND.value: "new_friend_count",
+}
+
+
+def empty_stats() -> dict:
+    return {
+        "christian_count": 0,
+        "vip_count": 0,
+        "new_friend_count": 0,
+        "total_count": 0,
+        "attendees": []
+    }
+
+
+def build_weekly_report(rows, unit_name: str, start_date: date, end_date: date) -> WeeklyAttendanceReport:
+    """
+    Build a weekly report from per-user attendance rows in one pass
+
+    Args:
+        rows: (user_id, name, level, meeting_type, record_count) rows, in
+            attendee order
+        unit_name: Name of the reported unit
+        start_date: Monday of the week
+        end_date: Sunday of the week
+
+    Returns:
+        WeeklyAttendanceReport: The report
+    """
+    sunday_stats = empty_stats()
+    group_stats = empty_stats()
+    unique_stats = empty_stats()
+
+    for row in rows:
+        if row.meeting_type == schemas.MeetingType.SUNDAY_SERVICE:
+            stats = sunday_stats
+        else:
+            stats = group_stats
+
+        # Counts are per attendance record, attendees are listed once
+        count_field = LEVEL_COUNT_FIELDS.get(row.level)
+        if count_field:
+            stats[count_field] += row.record_count
+        stats["total_count"] += row.record_count
+        stats["attendees"].append({
+            "id": row.user_id,
+            "name": row.name,
+            "level": row.level
+        })
+
+    # Unique attendees: Sunday service first, then group meeting only attendees.
+    # unique total_count stays 0 as it always has; clients use len(attendees)
+    seen_user_ids = set()
+    for attendee in sunday_stats["attendees"] + group_stats["attendees"]:
+        if attendee["id"] in seen_user_ids:
+            continue
+        seen_user_ids.add(attendee["id"])
+        unique_stats["attendees"].append(attendee)
+        count_field = LEVEL_COUNT_FIELDS.get(attendee["level"])
+        if count_field:
+            unique_stats[count_field] += 1
+
+    return WeeklyAttendanceReport(
+        sunday_service=AttendanceStats(**sunday_stats),
+        group_meeting=AttendanceStats(**group_stats),
+        unique=AttendanceStats(**unique_stats),
+        unit_name=unit_name,
+        start_date=start_date,
+        end_date=end_date
+    )
+
+
+def week_range(report_date: date):
+    """Get the Monday and Sunday of the week containing report_date"""
+    start_date = report_date - timedelta(days=report_date.weekday())
+    return start_date, start_date + timedelta(days=6)
+
+
+def period_start_of(day: date, granularity: TrendGranularity) -> date:
+    if granularity == TrendGranularity.MONTH:
+        return day.replace(day=1)
+    return day - timedelta(days=day.weekday())
+
+
+def next_period_start(start: date, granularity: TrendGranularity) -> date:
+    if granularity == TrendGranularity.MONTH:
+        if start.month == 12:
+            return date(start.year + 1, 1, 1)
+        return date(start.year, start.month + 1, 1)
+    return start + timedelta(days=7)
+
+
+def count_periods(start_date: date, end_date: date, granularity: TrendGranularity) -> int:
+    """Count the periods overlapping start_date..end_date without walking them"""
+    if granularity == TrendGranularity.MONTH:
+        return (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
+    first, last = period_start_of(start_date, granularity), period_start_of(end_date, granularity)
+    return (last - first).days // 7 + 1
+
+
+def query_attendance_trend(
+    db: Session,
+    unit_ids: Iterable[int],
+    start_date: date,
+    end_date: date,
+    granularity: TrendGranularity
+):
+    """
+    Count attendance per period, meeting type and level in one pass over the range
+
+    Per meeting type the rows count attendance records; the rows without a
+    meeting type (is_unique = 1) count distinct attendees across both types.
+
+    Args:
+        db: Database session
+        unit_ids: IDs of the units whose members are counted
+        start_date: First day of the range (inclusive)
+        end_date: Last day of the range (inclusive)
+        granularity: Size of each period
+
+    Returns:
+        List[Row]: (period_start, meeting_type, level, is_unique, record_count, attendee_count) rows
+    """
+    MA = models.Meeting_attendance
+    period = cast(func.date_trunc(literal_column(f"'{granularity.value}'"), MA.meeting_date), Date)
+    members = select(models.User_organization_units.user_id).where(
+        models.User_organization_units.unit_id.in_(list(unit_ids))
+    ).distinct()
+
+    return db.execute(
+        select(
+            period.label("period_start"),
+            MA.meeting_type,
+            models.User.level,
+            func.grouping(MA.meeting_type).label("is_unique"),
+            func.count().label("record_count"),
+            func.count(MA.user_id.distinct()).label("attendee_count")
+        ).join(
+            models.User, MA.user_id == models.User.id
+        ).where(
+            MA.meeting_date >= start_date,
+            MA.meeting_date <= end_date,
+            MA.user_id.in_(members)
+        ).group_by(
+            func.grouping_sets(
+                tuple_(period, models.User.level, MA.meeting_type),
+                tuple_(period, models.User.level)
+            )
+        )
+    ).all()
+
+
+def build_attendance_trend(
+    rows,
+    unit_name: str,
+    start_date: date,
+    end_date: date,
+    granularity: TrendGranularity
+) -> AttendanceTrendReport:
+    """
+    Build the trend time series, including empty periods, from aggregated rows
+
+    Args:
+        rows: Rows returned by query_attendance_trend
+        unit_name: Name of the reported unit
+        start_date: First day of the range
+        end_date: Last day of the range
+        granularity: Size of each period
+
+    Returns:
+        AttendanceTrendReport: One point per period overlapping the range
+    """
+    points = {}
+    period = period_start_of(start_date, granularity)
+    while period <= end_date:
+        following = next_period_start(period, granularity)
+        points[period] = AttendanceTrendPoint(
+            period_start=period,
+            period_end=following - timedelta(days=1),
+            sunday_service=AttendanceCounts(),
+            group_meeting=AttendanceCounts(),
+            unique=AttendanceCounts()
+        )
+        period = following
+
+    for row in rows:
+        point = points[row.period_start]
+        if row.is_unique:
+            counts, value = point.unique, row.attendee_count
+        elif row.meeting_type == schemas.MeetingType.SUNDAY_SERVICE:
+            counts, value = point.sunday_service, row.record_count
+        else:
+            counts, value = point.group_meeting, row.record_count
+
+        count_field = LEVEL_COUNT_FIELDS.get(row.level)
+        if count_field:
+            setattr(counts, count_field, getattr(counts, count_field) + value)
+        counts.total_count += value
+
+    return AttendanceTrendReport(
+        unit_name=unit_name,
+        granularity=granularity,
+        start_date=start_date,
+        end_date=end_date,
+        points=list(points.values())
+    )
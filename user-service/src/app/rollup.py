@@ -0,0 +1,415 @@
+"""
+Maintenance of the unit_weekly_attendance_summary rollup table
+
+Rebuild every summary from the raw attendance records with:
+
+    python -m app.rollup rebuild [--unit UNIT_ID] [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+"""
+import argparse
+from collections import defaultdict, namedtuple
+from datetime import date, timedelta
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from sqlalchemy import Date, Integer, and_, cast, delete, func, insert, literal_column, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from . import models
+from .reports import build_weekly_report
+from .schemas import WeeklyAttendanceReport
+
+logger = logging.getLogger(__name__)
+
+Summary = models.Unit_weekly_attendance_summary
+Closure = models.Organization_unit_closure
+Attendance = models.Meeting_attendance
+
+# First key of the advisory locks that serialize summary refreshes per unit
+SUMMARY_LOCK_NAMESPACE = 7291
+
+AttendeeRow = namedtuple("AttendeeRow", ["user_id", "name", "level", "meeting_type", "record_count"])
+
+WeekStarts = Union[Iterable[date], Select, None]
+
+
+def week_start_of(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _week_start_expr(column):
+    # date_trunc('week') starts weeks on Monday, like the weekly report
+    return cast(func.date_trunc(literal_column("'week'"), column), Date)
+
+
+def user_ancestor_units_query(user_ids: Iterable[int]) -> Select:
+    """Build a SELECT of every unit that has one of the users in its subtree"""
+    return select(Closure.ancestor_id).join(
+        models.User_organization_units,
+        models.User_organization_units.unit_id == Closure.descendant_id
+    ).where(
+        models.User_organization_units.user_id.in_(list(user_ids))
+    ).distinct()
+
+
+def user_weeks_query(user_ids: Iterable[int]) -> Select:
+    """Build a SELECT of the week starts in which any of the users attended a meeting"""
+    return select(_week_start_expr(Attendance.meeting_date)).where(
+        Attendance.user_id.in_(list(user_ids))
+    ).distinct()
+
+
+def _lock_units(db: Session, unit_ids: Union[List[int], Select], shared: bool = False) -> None:
+    # Locks are taken in ID order so concurrent refreshes cannot deadlock. Full
+    # refreshes lock their units exclusively, per-user updates share the locks.
+    lock = "pg_advisory_xact_lock_shared" if shared else "pg_advisory_xact_lock"
+    if isinstance(unit_ids, Select):
+        units = unit_ids.subquery("units")
+        db.execute(select(getattr(func, lock)(SUMMARY_LOCK_NAMESPACE, units.c[0])).order_by(units.c[0]))
+        return
+    if not unit_ids:
+        return
+    db.execute(
+        text(
+            f"SELECT {lock}(:namespace, unit_id) "
+            "FROM (SELECT unnest(CAST(:unit_ids AS integer[])) AS unit_id ORDER BY 1) AS units"
+        ),
+        {"namespace": SUMMARY_LOCK_NAMESPACE, "unit_ids": sorted(unit_ids)}
+    )
+
+
+def _members_query(unit_ids: Optional[List[int]] = None, user_ids: Optional[List[int]] = None):
+    # Subtree members of every unit, each counted once per unit
+    members = select(
+        Closure.ancestor_id.label("unit_id"),
+        models.User_organization_units.user_id
+    ).join(
+        models.User_organization_units,
+        models.User_organization_units.unit_id == Closure.descendant_id
+    ).distinct()
+    if unit_ids is not None:
+        members = members.where(Closure.ancestor_id.in_(unit_ids))
+    if user_ids is not None:
+        members = members.where(models.User_organization_units.user_id.in_(user_ids))
+    return members.subquery("members")
+
+
+def _per_user_query(members) -> Select:
+    # Record count and first record of each member per unit, week, meeting type and level
+    week_start = _week_start_expr(Attendance.meeting_date)
+    return select(
+        members.c.unit_id,
+        week_start.label("week_start"),
+        Attendance.meeting_type,
+        models.User.level,
+        Attendance.user_id,
+        func.count().label("record_count"),
+        func.min(Attendance.id).label("first_record_id")
+    ).join(
+        members, members.c.user_id == Attendance.user_id
+    ).join(
+        models.User, models.User.id == Attendance.user_id
+    ).group_by(
+        members.c.unit_id,
+        week_start,
+        Attendance.meeting_type,
+        models.User.level,
+        Attendance.user_id
+    )
+
+
+def _summary_query(per_user) -> Select:
+    # Summary rows in the order of SUMMARY_COLUMNS, attendees ordered by first record
+    return select(
+        per_user.c.unit_id,
+        per_user.c.week_start,
+        per_user.c.meeting_type,
+        per_user.c.level,
+        cast(func.sum(per_user.c.record_count), Integer),
+        cast(func.count(), Integer),
+        func.array_agg(aggregate_order_by(per_user.c.user_id, per_user.c.first_record_id)),
+        func.array_agg(aggregate_order_by(per_user.c.first_record_id, per_user.c.first_record_id)),
+        func.array_agg(aggregate_order_by(
+            cast(per_user.c.record_count, Integer),
+            per_user.c.first_record_id
+        ))
+    ).group_by(
+        per_user.c.unit_id,
+        per_user.c.week_start,
+        per_user.c.meeting_type,
+        per_user.c.level
+    )
+
+
+SUMMARY_COLUMNS = [
+    "unit_id",
+    "week_start",
+    "meeting_type",
+    "level",
+    "attendance_count",
+    "attendee_count",
+    "attendee_ids",
+    "first_record_ids",
+    "record_counts"
+]
+
+
+def refresh_weekly_summaries(
+    db: Session,
+    unit_ids: Optional[Iterable[int]] = None,
+    week_starts: WeekStarts = None
+) -> None:
+    """
+    Recompute summaries from the raw attendance records inside the current transaction
+
+    Used by the rebuild command and for changes that move many attendees at
+    once, like reparenting a unit. Attendance submissions use
+    refresh_user_week_summaries instead.
+
+    Args:
+        db: Database session
+        unit_ids: Units to refresh, all units if None
+        week_starts: Mondays of the weeks to refresh, given as dates or as a
+            SELECT returning them; all weeks if None
+    """
+    if unit_ids is not None:
+        unit_ids = sorted(set(unit_ids))
+        if not unit_ids:
+            return
+        _lock_units(db, unit_ids)
+    else:
+        db.execute(text("LOCK TABLE unit_weekly_attendance_summary IN SHARE ROW EXCLUSIVE MODE"))
+
+    week_list = None
+    if week_starts is not None and not isinstance(week_starts, Select):
+        week_list = sorted(set(week_starts))
+        if not week_list:
+            return
+
+    per_user = _per_user_query(_members_query(unit_ids))
+    week_start = _week_start_expr(Attendance.meeting_date)
+
+    stale = delete(Summary)
+    if unit_ids is not None:
+        stale = stale.where(Summary.unit_id.in_(unit_ids))
+    if week_list is not None:
+        # One index range scan over the span, then keep only the listed weeks
+        per_user = per_user.where(
+            Attendance.meeting_date.between(week_list[0], week_list[-1] + timedelta(days=6))
+        )
+        if (week_list[-1] - week_list[0]).days // 7 + 1 != len(week_list):
+            per_user = per_user.where(week_start.in_(week_list))
+        stale = stale.where(Summary.week_start.in_(week_list))
+    elif week_starts is not None:
+        per_user = per_user.where(week_start.in_(week_starts))
+        stale = stale.where(Summary.week_start.in_(week_starts))
+
+    db.execute(stale)
+    db.execute(insert(Summary).from_select(SUMMARY_COLUMNS, _summary_query(per_user.subquery("per_user"))))
+
+
+def _ordered_array(entries, column):
+    # ARRAY(SELECT column FROM entries ORDER BY first_record_id)
+    return func.array(select(column).order_by(entries.c.first_record_id).scalar_subquery())
+
+
+def _entries(attendee_ids, first_record_ids, record_counts):
+    return func.unnest(attendee_ids, first_record_ids, record_counts).table_valued(
+        "user_id", "first_record_id", "record_count"
+    ).render_derived()
+
+
+def refresh_user_week_summaries(db: Session, user_ids: Iterable[int], week_start: date) -> None:
+    """
+    Update one week's summaries after the attendance of some users changed
+
+    Only the users' own entries are replaced: they are removed from the summary
+    rows of their units and all ancestors, recounted from their raw records of
+    the week and merged back in. The other attendees' entries and counts are
+    kept as they are, so the result equals a full refresh without re-reading
+    the week of the whole subtree. Concurrent submissions only wait for each
+    other on the summary rows they share, for the rest of their transactions.
+
+    Args:
+        db: Database session
+        user_ids: Users whose records of the week were replaced
+        week_start: Monday of the week
+    """
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    units = user_ancestor_units_query(user_ids)
+    _lock_units(db, units, shared=True)
+    in_week = and_(Summary.week_start == week_start, Summary.unit_id.in_(units))
+    key = (Summary.unit_id, Summary.week_start, Summary.meeting_type, Summary.level)
+
+    # Lock the existing rows of the units in key order first, so concurrent
+    # updates cannot deadlock, then drop the users' entries
+    locked = select(*key).where(in_week).order_by(*key).with_for_update()
+    entries = _entries(Summary.attendee_ids, Summary.first_record_ids, Summary.record_counts)
+    kept = select(entries).where(entries.c.user_id.not_in(user_ids)).subquery("kept")
+    removed = select(entries).where(entries.c.user_id.in_(user_ids)).subquery("removed")
+    db.execute(
+        update(Summary)
+        .where(tuple_(*key).in_(locked), Summary.attendee_ids.overlap(user_ids))
+        .values(
+            attendance_count=Summary.attendance_count - select(
+                func.coalesce(func.sum(removed.c.record_count), 0)
+            ).scalar_subquery(),
+            attendee_count=Summary.attendee_count - select(func.count()).select_from(removed).scalar_subquery(),
+            attendee_ids=_ordered_array(kept, kept.c.user_id),
+            first_record_ids=_ordered_array(kept, kept.c.first_record_id),
+            record_counts=_ordered_array(kept, kept.c.record_count),
+            updated_at=func.now()
+        )
+    )
+
+    # Add the users' current entries, merging them into existing rows by first record
+    per_user = _per_user_query(_members_query(user_ids=user_ids)).where(
+        Attendance.user_id.in_(user_ids),
+        Attendance.meeting_date.between(week_start, week_start + timedelta(days=6))
+    ).subquery("per_user")
+    upsert = pg_insert(Summary).from_select(
+        SUMMARY_COLUMNS,
+        _summary_query(per_user).order_by(per_user.c.unit_id, per_user.c.meeting_type, per_user.c.level)
+    )
+    merged = _entries(
+        Summary.attendee_ids + upsert.excluded.attendee_ids,
+        Summary.first_record_ids + upsert.excluded.first_record_ids,
+        Summary.record_counts + upsert.excluded.record_counts
+    )
+    db.execute(
+        upsert.on_conflict_do_update(
+            index_elements=list(key),
+            set_={
+                "attendance_count": Summary.attendance_count + upsert.excluded.attendance_count,
+                "attendee_count": Summary.attendee_count + upsert.excluded.attendee_count,
+                "attendee_ids": _ordered_array(merged, merged.c.user_id),
+                "first_record_ids": _ordered_array(merged, merged.c.first_record_id),
+                "record_counts": _ordered_array(merged, merged.c.record_count),
+                "updated_at": func.now()
+            }
+        )
+    )
+
+    # Rows left without attendees do not exist after a full refresh either
+    db.execute(delete(Summary).where(in_week, Summary.attendee_count == 0))
+
+
+def read_weekly_report(db: Session, unit_id: int, unit_name: str, start_date: date, end_date: date):
+    """
+    Build a unit's weekly report from its summary rows
+
+    Args:
+        db: Database session
+        unit_id: ID of the organization unit
+        unit_name: Name of the organization unit
+        start_date: Monday of the week
+        end_date: Sunday of the week
+
+    Returns:
+        WeeklyAttendanceReport: The report, identical to one computed from raw records
+    """
+    return read_weekly_reports(db, [(unit_id, unit_name)], start_date, end_date)[unit_id]
+
+
+def read_weekly_reports(
+    db: Session,
+    units: Sequence[Tuple[int, str]],
+    start_date: date,
+    end_date: date
+) -> Dict[int, WeeklyAttendanceReport]:
+    """
+    Build the weekly reports of several units from one summary query and one users query
+
+    Args:
+        db: Database session
+        units: (unit ID, unit name) pairs
+        start_date: Monday of the week
+        end_date: Sunday of the week
+
+    Returns:
+        Dict[int, WeeklyAttendanceReport]: The report of each unit, by unit ID
+    """
+    summaries = db.execute(
+        select(Summary).where(
+            Summary.unit_id.in_([unit_id for unit_id, _ in units]),
+            Summary.week_start == start_date
+        )
+    ).scalars().all()
+    rows = _attendee_rows(db, summaries)
+    return {
+        unit_id: build_weekly_report(rows.get(unit_id, []), unit_name, start_date, end_date)
+        for unit_id, unit_name in units
+    }
+
+
+def _attendee_rows(db: Session, summaries) -> Dict[int, List[AttendeeRow]]:
+    # Re-expand the summary arrays into per-user rows in first-record order, per unit
+    entries = defaultdict(list)
+    for summary in summaries:
+        for user_id, first_record_id, record_count in zip(
+            summary.attendee_ids,
+            summary.first_record_ids,
+            summary.record_counts
+        ):
+            entries[summary.unit_id].append((first_record_id, user_id, summary.meeting_type, record_count))
+    if not entries:
+        return {}
+
+    users = {
+        row.id: row
+        for row in db.execute(
+            select(models.User.id, models.User.name, models.User.level).where(
+                models.User.id.in_(sorted({entry[1] for unit_entries in entries.values() for entry in unit_entries}))
+            )
+        )
+    }
+
+    rows = {}
+    for unit_id, unit_entries in entries.items():
+        rows[unit_id] = []
+        for _, user_id, meeting_type, record_count in sorted(unit_entries, key=lambda entry: entry[0]):
+            user = users.get(user_id)
+            if user is None:
+                continue
+            rows[unit_id].append(AttendeeRow(user_id, user.name, user.level, meeting_type, record_count))
+    return rows
+
+
+def rebuild(db: Session, unit_ids: Optional[List[int]] = None, start: Optional[date] = None, end: Optional[date] = None) -> None:
+    """Recompute summaries for the given units and date range and commit"""
+    week_starts = None
+    if start or end:
+        first_week = week_start_of(start) if start else week_start_of(
+            db.execute(select(func.min(Attendance.meeting_date))).scalar() or date.today()
+        )
+        last_week = week_start_of(end or date.today())
+        week_starts = [
+            first_week + timedelta(weeks=i)
+            for i in range((last_week - first_week).days // 7 + 1)
+        ]
+    refresh_weekly_summaries(db, unit_ids, week_starts)
+    db.commit()
+
+
+def main() -> None:
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain the weekly attendance summaries")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--unit", type=int, action="append", dest="unit_ids", help="Rebuild only this unit (repeatable)")
+    parser.add_argument("--from", type=date.fromisoformat, dest="start", help="First date to rebuild")
+    parser.add_argument("--to", type=date.fromisoformat, dest="end", help="Last date to rebuild")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        rebuild(db, args.unit_ids, args.start, args.end)
+        logger.info("Weekly attendance summaries rebuilt")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
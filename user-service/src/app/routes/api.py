@@ -1,15 +1,51 @@
-from datetime import date, timedelta
+from datetime import date
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.templating import Jinja2Templates
 from pydantic import ValidationError
-from sqlalchemy import and_
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import SQLAlchemyError, ProgrammingError, OperationalError
-from typing import Dict, List, Optional
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError, ProgrammingError, OperationalError
+from typing import Dict, List, Optional, Union
 from .. import schemas, models
-from ..database import get_db
-from app.schemas import AttendanceStats, PaginatedResponse, WeeklyAttendanceReport
+from ..batch import batch_body, parse_ids
+from ..cache import cached_response, invalidate_cache_tags
+from ..database import get_async_db, get_db, session_factory
+from ..export import stream_export
+from ..hierarchy import add_unit_to_closure, move_unit_in_closure
+from ..pagination import apply_keyset, keyset_page, slice_after
+from ..query_budget import max_queries
+from ..serialization import (
+    UNIT_FIELDS,
+    USER_COLUMNS,
+    USER_FIELDS,
+    fast_response,
+    objects_to_dicts,
+    rows_to_dicts,
+)
+from ..org_tree import aget_org_tree, get_org_tree, invalidate_org_tree
+from ..reports import (
+    MAX_TREND_PERIODS,
+    build_attendance_trend,
+    count_periods,
+    query_attendance_trend,
+    week_range,
+)
+from ..search import user_search_query
+from ..rollup import (
+    read_weekly_report,
+    read_weekly_reports,
+    refresh_user_week_summaries,
+    refresh_weekly_summaries,
+    user_ancestor_units_query,
+    user_weeks_query,
+    week_start_of,
+)
+from ..user_import import import_users
+from app.schemas import AttendanceTrendReport, BatchResponse, ChildUnitsWeeklyAttendanceReport, ExportFormat, PaginatedResponse, TrendGranularity, WeeklyAttendanceReport
 
 router = APIRouter()
 
@@ -67,12 +103,45 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
         db.add(db_user)
         db.commit()
         db.refresh(db_user)
+        invalidate_cache_tags("users")
         return db_user
     except ValidationError as e:
         raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/users/import", response_model=schemas.UserImportResult)
+def import_users_from_file(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    """
+    Create users and their unit assignments in bulk from a CSV or JSONL file
+    
+    Each row has the UserCreate fields plus an optional unit_id. Valid rows are
+    imported in one transaction; invalid rows are skipped and reported.
+    
+    Args:
+        file: A .csv file with a header row, or a .jsonl/.ndjson file
+        db: Database session dependency
+        
+    Returns:
+        UserImportResult: Number of imported rows and the errors per skipped line
+        
+    Raises:
+        HTTPException: If the file cannot be read or the import fails
+    """
+    try:
+        result = import_users(db, get_org_tree(), file.filename or "", file.file.read())
+        db.commit()
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if result.imported:
+        invalidate_cache_tags("users", "user_organization_units")
+    return result
+
 @router.get("/user/update")
 async def get_user_update_form(request: Request):
     return templates.TemplateResponse(
@@ -93,23 +162,116 @@ async def get_user_delete_form(request: Request):
         }
     )
 
-@router.get("/users/", response_model=List[schemas.UserInDB])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@router.get("/users/", response_model=Union[List[schemas.UserInDB], PaginatedResponse[schemas.UserInDB]])
+@cached_response("users")
+@max_queries(1)
+def read_users(
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
     """
     Get a paginated list of users
     
     Args:
+        request: The request, its Accept header picks JSON or MessagePack
         skip: Number of records to skip
         limit: Maximum number of records to return
+        after: Cursor (last user ID of the previous page), switches to cursor mode
         db: Database session dependency
         
     Returns:
-        List[UserInDB]: List of user objects
+        List[UserInDB]: List of user objects, or a PaginatedResponse with
+            next_cursor in cursor mode
     """
-    users = db.query(models.User).offset(skip).limit(limit).all()
-    return users
+    query = select(*USER_COLUMNS)
+    if after is not None:
+        page = keyset_page(db.execute(apply_keyset(query, models.User.id, after, limit)).all(), limit)
+        page["items"] = rows_to_dicts(page["items"], USER_FIELDS)
+        return fast_response(request, page, utc_z=True)
+
+    users = db.execute(query.offset(skip).limit(limit)).all()
+    return fast_response(request, rows_to_dicts(users, USER_FIELDS), utc_z=True)
+
+@router.get("/users/search", response_model=List[schemas.UserInDB])
+@cached_response("users", "user_organization_units", "organization_units")
+@max_queries(2)
+async def search_users(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100),
+    unit_id: Optional[int] = None,
+    level: Optional[schemas.UserLevel] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Search users by name, email or mobile number, best matches first
+    
+    Args:
+        request: The request, its Accept header picks JSON or MessagePack
+        q: Text to find anywhere in the name, email or mobile number
+        unit_id: Only members of this unit and its sub-units
+        level: Only users of this level
+        limit: Maximum number of users to return
+        db: Database session dependency
+        
+    Returns:
+        List[UserInDB]: Matching users ranked by similarity
+        
+    Raises:
+        HTTPException: If the unit is not found
+    """
+    term = q.strip()
+    if not term:
+        return fast_response(request, [])
+
+    unit_ids = None
+    if unit_id is not None:
+        tree = await aget_org_tree()
+        if tree.get(unit_id) is None:
+            raise HTTPException(status_code=404, detail="Organization unit not found")
+        unit_ids = tree.subtree_ids(unit_id)
+
+    users = (await db.execute(
+        user_search_query(term, limit, unit_ids, level.value if level is not None else None)
+    )).all()
+    return fast_response(request, rows_to_dicts(users, USER_FIELDS), utc_z=True)
+
+@router.get("/users/batch", response_model=BatchResponse[schemas.UserInDB])
+@cached_response("users")
+@max_queries(1)
+def read_users_batch(
+    request: Request,
+    ids: List[str] = Query(..., description="Comma-separated user IDs, e.g. 3,1,2"),
+    db: Session = Depends(get_db)
+):
+    """
+    Get several users by ID with one query
+    
+    Args:
+        request: The request, its Accept header picks JSON or MessagePack
+        ids: User IDs, comma-separated or repeated
+        db: Database session dependency
+        
+    Returns:
+        BatchResponse[UserInDB]: The users in the requested order and the IDs not found
+        
+    Raises:
+        HTTPException: If the IDs are invalid
+    """
+    try:
+        user_ids = parse_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    users = db.execute(select(*USER_COLUMNS).where(models.User.id.in_(sorted(set(user_ids))))).all()
+    found = {user["id"]: user for user in rows_to_dicts(users, USER_FIELDS)}
+    return fast_response(request, batch_body(user_ids, found), utc_z=True)
 
 @router.get("/user/{user_id}", response_model=schemas.UserInDB)
+@cached_response("users")
 def read_user(user_id: int, db: Session = Depends(get_db)):
     """
     Get a specific user by ID
@@ -159,11 +321,23 @@ def update_user(user_id: int, user: schemas.UserUpdate, db: Session = Depends(ge
         
         # Update user data
         update_data = user.model_dump(exclude_unset=True)
+        level_changed = "level" in update_data and update_data["level"] != db_user.level
         for key, value in update_data.items():
             setattr(db_user, key, value)
+
+        # Weekly summaries are counted per level
+        if level_changed:
+            db.flush()
+            refresh_weekly_summaries(
+                db,
+                db.execute(user_ancestor_units_query([user_id])).scalars().all(),
+                user_weeks_query([user_id])
+            )
         
         db.commit()
         db.refresh(db_user)
+
+        invalidate_cache_tags("users")
         return db_user
     
     except ValidationError as e:
@@ -199,10 +373,20 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
         db.query(models.User_organization_units).filter(
             models.User_organization_units.user_id == user_id
         ).delete()
+
+        # 刪除帶領者時外鍵會把單位的 leader_id 設為 NULL，快取的組織樹也需更新
+        leads_units = db.query(models.Organization_units.id).filter(
+            models.Organization_units.leader_id == user_id
+        ).first() is not None
         
         # Delete user
         db.delete(db_user)
         db.commit()
+        if leads_units:
+            invalidate_org_tree()
+            invalidate_cache_tags("users", "user_organization_units", "organization_units")
+        else:
+            invalidate_cache_tags("users", "user_organization_units")
         
         return {"message": "User successfully deleted"}
     
@@ -242,14 +426,19 @@ def create_organization_category(
     db.add(db_category)
     db.commit()
     db.refresh(db_category)
+    invalidate_cache_tags("organization_categories")
     return db_category
 
 @router.get("/organization-categories/", response_model=PaginatedResponse[schemas.OrganizationCategoryInDB])
+@cached_response("organization_categories")
+@max_queries(2)
 async def read_organization_categories(
     skip: int = 0, 
     limit: int = 100,
     search: Optional[str] = None,
-    db: Session = Depends(get_db)
+    after: Optional[int] = None,
+    include_total: bool = True,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get a paginated list of organization categories with optional search
@@ -258,18 +447,29 @@ async def read_organization_categories(
         skip: Number of records to skip
         limit: Maximum number of records to return
         search: Optional search term for category names
+        after: Cursor (last category ID of the previous page), replaces skip
+        include_total: Whether to run the extra count query
         db: Database session dependency
         
     Returns:
         PaginatedResponse: Paginated list of organization categories
     """
-    query = db.query(models.Organization_categories)
+    query = select(models.Organization_categories)
     
     if search:
-        query = query.filter(models.Organization_categories.category_name.ilike(f"%{search}%"))
+        query = query.where(models.Organization_categories.category_name.ilike(f"%{search}%"))
     
-    total = query.count()
-    categories = query.offset(skip).limit(limit).all()
+    total = None
+    if include_total:
+        total = (await db.execute(select(func.count()).select_from(query.subquery()))).scalar_one()
+
+    if after is not None:
+        rows = (await db.execute(
+            apply_keyset(query, models.Organization_categories.id, after, limit)
+        )).scalars().all()
+        return keyset_page(rows, limit, total)
+
+    categories = (await db.execute(query.offset(skip).limit(limit))).scalars().all()
     
     return {
         "items": categories,
@@ -306,12 +506,27 @@ def create_organization_unit(
     """
     db_unit = models.Organization_units(**unit.model_dump())
     db.add(db_unit)
+    db.flush()
+    add_unit_to_closure(db, db_unit.id, db_unit.parent_unit_id)
     db.commit()
+    invalidate_org_tree()
+    invalidate_cache_tags("organization_units")
     db.refresh(db_unit)
     return db_unit
 
-@router.get("/organization-units/", response_model=List[schemas.OrganizationUnitInDB])
-def read_organization_units(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@router.get("/organization-units/", response_model=Union[List[schemas.OrganizationUnitInDB], PaginatedResponse[schemas.OrganizationUnitInDB]])
+@cached_response("organization_units")
+@max_queries(1)
+def read_organization_units(
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    if after is not None:
+        query = apply_keyset(db.query(models.Organization_units), models.Organization_units.id, after, limit)
+        return keyset_page(query.all(), limit)
+
     units = db.query(models.Organization_units).offset(skip).limit(limit).all()
     return units
 
@@ -327,72 +542,113 @@ async def get_organization_unit_update_form(request: Request):
     )
 
 @router.get("/organization-units/hierarchy", response_model=List[dict])
-async def get_organization_hierarchy(
-    db: Session = Depends(get_db)
-):
+@cached_response("organization_units")
+@max_queries(1)
+async def get_organization_hierarchy(request: Request):
     """
     Get the complete hierarchical structure of organization units
     
-    Args:
-        db: Database session dependency
-        
     Returns:
         List[dict]: Nested dictionary representing the organization hierarchy
     """
-    def build_hierarchy(parent_id: Optional[int] = None):
-        units = db.query(models.Organization_units)\
-            .filter(models.Organization_units.parent_unit_id == parent_id)\
-            .all()
-        
-        return [
-            {
-                "id": unit.id,
-                "name": unit.unit_name,
-                "category_id": unit.category_id,
-                "leader_id": unit.leader_id,
-                "children": build_hierarchy(unit.id)
-            }
-            for unit in units
-        ]
-    
-    return build_hierarchy()
+    return fast_response(request, (await aget_org_tree()).hierarchy())
 
 @router.get("/organization-units/hierarchy-up/{unit_id}", response_model=List[schemas.OrganizationUnitInDB])
-async def get_unit_hierarchy_up(unit_id: int, db: Session = Depends(get_db)):
+@cached_response("organization_units")
+@max_queries(1)
+async def get_unit_hierarchy_up(unit_id: int, request: Request):
     """
     Get the complete hierarchy from a unit up to the branch level
     
     Args:
         unit_id: ID of the starting unit
-        db: Database session
         
     Returns:
         List[OrganizationUnitInDB]: List of units in hierarchical order (bottom to top)
     """
     try:
-        units = []
-        current_unit_id = unit_id
-        
-        while current_unit_id is not None:
-            # Get current unit
-            current_unit = db.query(models.Organization_units).filter(
-                models.Organization_units.id == current_unit_id
-            ).first()
-            
-            if not current_unit:
-                break
-                
-            units.append(current_unit)
-            current_unit_id = current_unit.parent_unit_id
-            
-        return units
+        return fast_response(request, objects_to_dicts((await aget_org_tree()).ancestors(unit_id), UNIT_FIELDS))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
 
+@router.get(
+    "/organization-units/options",
+    response_model=List[schemas.UnitOption],
+    response_model_exclude_none=True
+)
+@cached_response("organization_units", "user_organization_units", "users")
+@max_queries(2)
+async def read_organization_unit_options(
+    category_id: Optional[int] = None,
+    include_members: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get the whole option tree for the cascading unit selects in one call
+
+    Args:
+        category_id: Category of the top level units, the root units if None
+        include_members: Also list the direct members of every unit
+        db: Database session dependency
+
+    Returns:
+        List[UnitOption]: Nested units, each with its children and optionally its members
+    """
+    tree = await aget_org_tree()
+    roots = tree.children_of(None) if category_id is None else tree.in_category(category_id)
+
+    members = None
+    if include_members:
+        members = {}
+        rows = await db.execute(
+            select(
+                models.User_organization_units.unit_id,
+                models.User.id,
+                models.User.name
+            ).join(
+                models.User, models.User.id == models.User_organization_units.user_id
+            ).order_by(models.User.id)
+        )
+        for row in rows:
+            members.setdefault(row.unit_id, []).append({"id": row.id, "name": row.name})
+
+    return tree.options(roots, members)
+
+@router.get("/organization-units/batch", response_model=BatchResponse[schemas.OrganizationUnitInDB])
+@cached_response("organization_units")
+@max_queries(1)
+async def read_organization_units_batch(
+    request: Request,
+    ids: List[str] = Query(..., description="Comma-separated unit IDs, e.g. 3,1,2")
+):
+    """
+    Get several organization units by ID from the cached organization tree
+    
+    Args:
+        request: The request, its Accept header picks JSON or MessagePack
+        ids: Unit IDs, comma-separated or repeated
+        
+    Returns:
+        BatchResponse[OrganizationUnitInDB]: The units in the requested order and the IDs not found
+        
+    Raises:
+        HTTPException: If the IDs are invalid
+    """
+    try:
+        unit_ids = parse_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    tree = await aget_org_tree()
+    units = [unit for unit in map(tree.get, set(unit_ids)) if unit is not None]
+    found = {unit["id"]: unit for unit in objects_to_dicts(units, UNIT_FIELDS)}
+    return fast_response(request, batch_body(unit_ids, found))
+
 @router.get("/organization-units/{unit_id}", response_model=schemas.OrganizationUnitInDB)
+@cached_response("organization_units")
 def read_organization_unit(unit_id: int, db: Session = Depends(get_db)):
     db_unit = db.query(models.Organization_units).filter(models.Organization_units.id == unit_id).first()
     if db_unit is None:
@@ -410,53 +666,64 @@ def update_organization_unit(
     if not db_unit:
         raise HTTPException(status_code=404, detail="Organization unit not found")
 
-    # Update data
-    for key, value in unit.dict(exclude_unset=True).items():
-        setattr(db_unit, key, value)
+    update_data = unit.dict(exclude_unset=True)
 
     try:
+        # Keep the closure table and the weekly summaries of the old and new
+        # ancestors in sync when the unit is moved to another parent
+        if "parent_unit_id" in update_data and update_data["parent_unit_id"] != db_unit.parent_unit_id:
+            tree = get_org_tree()
+            moved_ancestor_ids = [u.id for u in tree.ancestors(unit_id)[1:]]
+            move_unit_in_closure(db, unit_id, update_data["parent_unit_id"])
+            if update_data["parent_unit_id"] is not None:
+                moved_ancestor_ids.extend(u.id for u in tree.ancestors(update_data["parent_unit_id"]))
+            refresh_weekly_summaries(db, moved_ancestor_ids)
+
+        # Update data
+        for key, value in update_data.items():
+            setattr(db_unit, key, value)
+
         db.commit()
+        invalidate_org_tree()
+        invalidate_cache_tags("organization_units")
         return db_unit
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
     except SQLAlchemyError as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
     
 @router.get("/organization-units/{unit_id}/members", response_model=List[schemas.UserInDB])
+@cached_response("organization_units", "user_organization_units", "users")
+@max_queries(2)
 async def get_unit_members(
     unit_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     獲取指定組織單位及其所有子單位的所有成員
     
     Args:
         unit_id: 組織單位ID
+        request: 請求，依 Accept 標頭回傳 JSON 或 MessagePack
         db: 資料庫連線
         
     Returns:
         List[UserInDB]: 該單位及其所有子單位的成員列表
     """
     try:
-        # 遞迴獲取所有子單位ID的函數
-        def get_all_sub_units(parent_unit_id):
-            sub_units = db.query(models.Organization_units.id).filter(
-                models.Organization_units.parent_unit_id == parent_unit_id
-            ).all()
-            unit_ids = [parent_unit_id]
-            for sub_unit in sub_units:
-                unit_ids.extend(get_all_sub_units(sub_unit.id))
-            return unit_ids
-
-        # 獲取當前單位及其所有子單位的ID
-        all_unit_ids = get_all_sub_units(unit_id)
-
-        # 查詢所有相關單位的成員
-        members = db.query(models.User).distinct().join(
-            models.User_organization_units,
-            models.User.id == models.User_organization_units.user_id
-        ).filter(
-            models.User_organization_units.unit_id.in_(all_unit_ids)
-        ).all()
+        # 查詢當前單位及其所有子單位的成員，子單位由快取的組織樹解析
+        tree = await aget_org_tree()
+        members = (await db.execute(
+            select(*USER_COLUMNS).distinct().join(
+                models.User_organization_units,
+                models.User.id == models.User_organization_units.user_id
+            ).where(
+                models.User_organization_units.unit_id.in_(list(tree.subtree_ids(unit_id)))
+            )
+        )).all()
         
         if not members:
             raise HTTPException(
@@ -464,7 +731,7 @@ async def get_unit_members(
                 detail=f"No members found in unit {unit_id} or its sub-units"
             )
         
-        return members
+        return fast_response(request, rows_to_dicts(members, USER_FIELDS), utc_z=True)
         
     except Exception as e:
         raise HTTPException(
@@ -472,43 +739,64 @@ async def get_unit_members(
             detail=f"Error retrieving members: {str(e)}"
         )
     
-@router.get("/organization-units/by-parent-unit/{parent_unit_id}", response_model=List[schemas.OrganizationUnitInDB])
-def read_units_by_parent_unit(parent_unit_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    units = db.query(models.Organization_units)\
-        .filter(models.Organization_units.parent_unit_id == parent_unit_id)\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
-    return units
+@router.get("/organization-units/{unit_id}/members/export")
+def export_unit_members(request: Request, unit_id: int, format: ExportFormat = ExportFormat.CSV):
+    """
+    Download the members of an organization unit and all its sub-units
+    
+    Args:
+        unit_id: ID of the organization unit
+        format: "csv" or "ndjson"
+        
+    Returns:
+        StreamingResponse: One row per member, streamed in batches
+    """
+    tree = get_org_tree()
+    if tree.get(unit_id) is None:
+        raise HTTPException(status_code=404, detail="Organization unit not found")
+
+    query = select(*USER_COLUMNS).where(
+        models.User.id.in_(
+            select(models.User_organization_units.user_id).where(
+                models.User_organization_units.unit_id.in_(list(tree.subtree_ids(unit_id)))
+            )
+        )
+    ).order_by(models.User.id)
+    return stream_export(query, USER_FIELDS, format, f"unit-{unit_id}-members", session_factory(request))
 
-@router.get("/organization-units/by-category/{category_id}", response_model=List[schemas.OrganizationUnitInDB])
+@router.get("/organization-units/by-parent-unit/{parent_unit_id}", response_model=Union[List[schemas.OrganizationUnitInDB], PaginatedResponse[schemas.OrganizationUnitInDB]])
+@cached_response("organization_units")
+@max_queries(1)
+def read_units_by_parent_unit(parent_unit_id: int, skip: int = 0, limit: int = 100, after: Optional[int] = None):
+    units = get_org_tree().children_of(parent_unit_id)
+    if after is not None:
+        return keyset_page(slice_after(units, after, limit), limit, len(units))
+    return units[skip:skip + limit]
+
+@router.get("/organization-units/by-category/{category_id}", response_model=Union[List[schemas.OrganizationUnitInDB], PaginatedResponse[schemas.OrganizationUnitInDB]])
+@cached_response("organization_units")
+@max_queries(1)
 async def read_organization_units_by_category(
     category_id: int,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    after: Optional[int] = None
 ):
-    units = db.query(models.Organization_units)\
-        .filter(models.Organization_units.category_id == category_id)\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
-    return units
+    units = (await aget_org_tree()).in_category(category_id)
+    if after is not None:
+        return keyset_page(slice_after(units, after, limit), limit, len(units))
+    return units[skip:skip + limit]
 
 @router.get("/organization-units/by-parent-category/{category_id}", response_model=List[schemas.OrganizationUnitInDB])
+@cached_response("organization_units")
+@max_queries(1)
 async def read_parent_organization_units_by_category(
     category_id: int,
     skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    limit: int = 100
 ):
     parent_category_id = category_id - 1
-    units = db.query(models.Organization_units)\
-        .filter(models.Organization_units.category_id == parent_category_id)\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
-    return units
+    return (await aget_org_tree()).in_category(parent_category_id)[skip:skip + limit]
 
 # User Organization Unit routes
 @router.post("/user-organization-units/", response_model=schemas.UserOrganizationUnitInDB)
@@ -518,11 +806,25 @@ def create_user_organization_unit(
 ):
     db_user_unit = models.User_organization_units(**user_unit.model_dump())
     db.add(db_user_unit)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="User already belongs to this unit or does not exist")
+
+    # The user's past attendance now also counts for the new unit and its ancestors
+    refresh_weekly_summaries(
+        db,
+        [u.id for u in get_org_tree().ancestors(user_unit.unit_id)],
+        user_weeks_query([user_unit.user_id])
+    )
     db.commit()
     db.refresh(db_user_unit)
+    invalidate_cache_tags("user_organization_units")
     return db_user_unit
 
 @router.get("/user-organization-units/by-user/{user_id}", response_model=List[schemas.UserOrganizationUnitInDB])
+@cached_response("user_organization_units")
 def read_user_organization_units(user_id: int, db: Session = Depends(get_db)):
     user_units = db.query(models.User_organization_units).filter(
         models.User_organization_units.user_id == user_id
@@ -530,14 +832,19 @@ def read_user_organization_units(user_id: int, db: Session = Depends(get_db)):
     return user_units
 
 @router.get("/users/{user_id}/organization-units", response_model=List[schemas.OrganizationUnitInDB])
+@cached_response("organization_units", "user_organization_units")
 async def get_user_organization_units(
     user_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    units = db.query(models.Organization_units)\
-        .select_from(models.User_organization_units)\
-        .filter(models.User_organization_units.user_id == user_id)\
-        .all()
+    units = (await db.execute(
+        select(models.Organization_units)
+        .join(
+            models.User_organization_units,
+            models.User_organization_units.unit_id == models.Organization_units.id
+        )
+        .where(models.User_organization_units.user_id == user_id)
+    )).scalars().all()
     return units
 
 # Attendance API
@@ -562,9 +869,10 @@ async def get_attendance_record_by_query(request: Request):
     )
 
 @router.post("/attendance/submit")
+@max_queries(7)
 async def submit_attendance(
     data: Dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Submit attendance records for multiple users
@@ -605,62 +913,75 @@ async def submit_attendance(
                 detail="缺少出席資料。"
             )
 
-        attendance_records = []
-        
-        # 處理每個成員的出席記錄
+        # 解析所有用戶 ID
+        user_meetings = {}
         for user_id, meetings in data['attendance'].items():
             try:
-                user_id = int(user_id)
-                # 檢查用戶是否存在
-                user = db.query(models.User).filter(models.User.id == user_id).first()
-                if not user:
-                    raise HTTPException(
-                        status_code=status.HTTP_404_NOT_FOUND,
-                        detail=f"找不到 ID 為 {user_id} 的用戶"
-                    )
-
-                # 檢查是否已有該日期的出席記錄
-                existing_records = db.query(models.Meeting_attendance).filter(
-                    models.Meeting_attendance.user_id == user_id,
-                    models.Meeting_attendance.meeting_date == attendance_date
-                ).all()
-
-                if existing_records:
-                    # 如果有現有記錄，刪除它們
-                    for record in existing_records:
-                        db.delete(record)
-
-                # 添加新的出席記錄
-                if meetings.get('sunday'):
-                    attendance_records.append(
-                        models.Meeting_attendance(
-                            user_id=user_id,
-                            meeting_type=schemas.MeetingType.SUNDAY_SERVICE,
-                            meeting_date=attendance_date
-                        )
-                    )
-                
-                if meetings.get('group'):
-                    attendance_records.append(
-                        models.Meeting_attendance(
-                            user_id=user_id,
-                            meeting_type=schemas.MeetingType.GROUP_MEETING,
-                            meeting_date=attendance_date
-                        )
-                    )
-
+                user_meetings[int(user_id)] = meetings
             except ValueError:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail=f"無效的用戶 ID: {user_id}"
                 )
+        user_ids = sorted(user_meetings)
+
+        attendance_records = []
+        for user_id, meetings in user_meetings.items():
+            if meetings.get('sunday'):
+                attendance_records.append({
+                    "user_id": user_id,
+                    "meeting_type": schemas.MeetingType.SUNDAY_SERVICE,
+                    "meeting_date": attendance_date
+                })
+
+            if meetings.get('group'):
+                attendance_records.append({
+                    "user_id": user_id,
+                    "meeting_type": schemas.MeetingType.GROUP_MEETING,
+                    "meeting_date": attendance_date
+                })
 
-        # 批量新增出席記錄
         try:
-            db.bulk_save_objects(attendance_records)
-            db.commit()
+            # 一次查詢驗證所有用戶，並依 ID 順序鎖定，
+            # 讓涉及相同用戶的提交依序執行而不會交錯
+            existing_user_ids = set((await db.execute(
+                select(models.User.id)
+                .where(models.User.id.in_(user_ids))
+                .order_by(models.User.id)
+                .with_for_update()
+            )).scalars())
+
+            missing_user_ids = [user_id for user_id in user_meetings if user_id not in existing_user_ids]
+            if missing_user_ids:
+                await db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"找不到 ID 為 {missing_user_ids[0]} 的用戶"
+                )
+
+            # 一次刪除這些用戶在該日期的現有記錄
+            await db.execute(
+                delete(models.Meeting_attendance).where(
+                    models.Meeting_attendance.user_id.in_(user_ids),
+                    models.Meeting_attendance.meeting_date == attendance_date
+                )
+            )
+
+            # 以單一多列 INSERT 新增出席記錄
+            if attendance_records:
+                await db.execute(
+                    pg_insert(models.Meeting_attendance)
+                    .values(attendance_records)
+                    .on_conflict_do_nothing(constraint="uq_meeting_attendance_user_type_date")
+                )
+
+            # 在同一交易中只替換這些成員在所屬單位及所有上層單位週統計中的資料，
+            # 不重算整週
+            await db.run_sync(refresh_user_week_summaries, user_ids, week_start_of(attendance_date))
+            await db.commit()
+            await run_in_threadpool(invalidate_cache_tags, "attendance")
         except ProgrammingError as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"資料庫結構錯誤: {str(e)}")
             if 'column "meeting_date" of relation "meeting_attendance" does not exist' in str(e):
                 raise HTTPException(
@@ -672,14 +993,14 @@ async def submit_attendance(
                 detail="資料庫操作錯誤，請聯繫系統管理員。"
             )
         except OperationalError as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"資料庫連線錯誤: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="無法連接到資料庫，請稍後再試。"
             )
         except SQLAlchemyError as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"資料庫錯誤: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -702,6 +1023,8 @@ async def submit_attendance(
         )
 
 @router.get('/attendance/weekly/report/{unit_id}', response_model=WeeklyAttendanceReport)
+@cached_response("attendance", "organization_units", "user_organization_units", "users", today_params=("report_date",))
+@max_queries(3)
 def read_weekly_attendance_report_by_unit(
     unit_id: int, 
     report_date: date = None,
@@ -716,9 +1039,8 @@ def read_weekly_attendance_report_by_unit(
     """
     try:
         # Get the organization unit
-        unit = db.query(models.Organization_units).filter(
-            models.Organization_units.id == unit_id
-        ).first()
+        tree = get_org_tree()
+        unit = tree.get(unit_id)
         
         if not unit:
             raise HTTPException(
@@ -731,125 +1053,168 @@ def read_weekly_attendance_report_by_unit(
             report_date = date.today()
             
         # Get Monday (start) and Sunday (end) of the week
-        start_date = report_date - timedelta(days=report_date.weekday())
-        end_date = start_date + timedelta(days=6)
-        
-        # Get all sub-units recursively
-        def get_all_sub_units(parent_unit_id):
-            sub_units = db.query(models.Organization_units.id).filter(
-                models.Organization_units.parent_unit_id == parent_unit_id
-            ).all()
-            unit_ids = [parent_unit_id]
-            for sub_unit in sub_units:
-                unit_ids.extend(get_all_sub_units(sub_unit.id))
-            return unit_ids
-
-        # Get all unit IDs including the target unit and its sub-units
-        all_unit_ids = get_all_sub_units(unit_id)
-        
-        # Get all members from all related units
-        unit_members = db.query(models.User).distinct().join(
-            models.User_organization_units,
-            models.User.id == models.User_organization_units.user_id
-        ).filter(
-            models.User_organization_units.unit_id.in_(all_unit_ids)
-        ).all()
-        
-        # Initialize stats for both meeting types
-        sunday_stats = {
-            "christian_count": 0,
-            "vip_count": 0,
-            "new_friend_count": 0,
-            "total_count": 0,
-            "attendees": []
-        }
+        start_date, end_date = week_range(report_date)
         
-        group_stats = {
-            "christian_count": 0,
-            "vip_count": 0,
-            "new_friend_count": 0,
-            "total_count": 0,
-            "attendees": []
-        }
+        # Served from the rollup maintained by /attendance/submit
+        return read_weekly_report(db, unit_id, unit.unit_name, start_date, end_date)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
 
-        unique_stats = {
-            "christian_count": 0,
-            "vip_count": 0,
-            "new_friend_count": 0,
-            "total_count": 0,
-            "attendees": []
-        }
+@router.get('/attendance/weekly/report/{unit_id}/children', response_model=ChildUnitsWeeklyAttendanceReport)
+@cached_response("attendance", "organization_units", "user_organization_units", "users", today_params=("report_date",))
+@max_queries(3)
+def read_weekly_attendance_report_by_child_units(
+    unit_id: int,
+    report_date: date = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Get the weekly attendance reports of a unit and each of its direct child units
+    
+    Args:
+        unit_id: The ID of the organization unit
+        report_date: The date within the week to generate reports for (defaults to current date)
         
-        # Get attendance records for the week
-        attendance_records = db.query(models.Meeting_attendance).join(
-            models.User,
-            models.Meeting_attendance.user_id == models.User.id
-        ).filter(
-            and_(
-                models.Meeting_attendance.meeting_date >= start_date,
-                models.Meeting_attendance.meeting_date <= end_date,
-                models.User.id.in_([member.id for member in unit_members])
-            )
-        ).all()
-        
-        # Process attendance records
-        for record in attendance_records:
-            user = next(m for m in unit_members if m.id == record.user_id)
-            attendee_info = {
-                "id": user.id,
-                "name": user.name,
-                "level": user.level
-            }
-            
-            # Update stats based on meeting type
-            if record.meeting_type == schemas.MeetingType.SUNDAY_SERVICE:
-                stats = sunday_stats
-            else:
-                stats = group_stats
-                
-            if user.level == schemas.UserLevel.CHRISTIAN:
-                stats["christian_count"] += 1
-            elif user.level == schemas.UserLevel.VIP:
-                stats["vip_count"] += 1
-            elif user.level == schemas.UserLevel.NEW_FRIEND:
-                stats["new_friend_count"] += 1
-                
-            stats["total_count"] += 1
-            if attendee_info not in stats["attendees"]:
-                stats["attendees"].append(attendee_info)
-        
-        # Calculate unique attendees
-        for attendee in sunday_stats["attendees"]:
-            if attendee not in unique_stats["attendees"]:
-                unique_stats["attendees"].append(attendee)
-                if attendee["level"] == schemas.UserLevel.CHRISTIAN:
-                    unique_stats["christian_count"] += 1
-                elif attendee["level"] == schemas.UserLevel.VIP:
-                    unique_stats["vip_count"] += 1
-                elif attendee["level"] == schemas.UserLevel.NEW_FRIEND:
-                    unique_stats["new_friend_count"] += 1
-
-        for attendee in group_stats["attendees"]:
-            if attendee not in unique_stats["attendees"]:
-                unique_stats["attendees"].append(attendee)
-                if attendee["level"] == schemas.UserLevel.CHRISTIAN:
-                    unique_stats["christian_count"] += 1
-                elif attendee["level"] == schemas.UserLevel.VIP:
-                    unique_stats["vip_count"] += 1
-                elif attendee["level"] == schemas.UserLevel.NEW_FRIEND:
-                    unique_stats["new_friend_count"] += 1
-        
-        return WeeklyAttendanceReport(
-            sunday_service=AttendanceStats(**sunday_stats),
-            group_meeting=AttendanceStats(**group_stats),
-            unique=AttendanceStats(**unique_stats),
-            unit_name=unit.unit_name,
-            start_date=start_date,
-            end_date=end_date
+    Returns:
+        ChildUnitsWeeklyAttendanceReport: The unit's total and one report per child unit,
+            in the same order as the organization tree lists them
+    """
+    tree = get_org_tree()
+    unit = tree.get(unit_id)
+    if not unit:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Organization unit not found"
+        )
+
+    start_date, end_date = week_range(report_date or date.today())
+    units = [(unit.id, unit.unit_name)] + [(child.id, child.unit_name) for child in tree.children_of(unit_id)]
+    # Every unit's summary rows already cover its subtree, so all reports come
+    # from one summary query and one users query
+    reports = read_weekly_reports(db, units, start_date, end_date)
+    return ChildUnitsWeeklyAttendanceReport(
+        total=schemas.UnitWeeklyAttendanceReport(unit_id=unit_id, **dict(reports[unit_id])),
+        children=[
+            schemas.UnitWeeklyAttendanceReport(unit_id=child_id, **dict(reports[child_id]))
+            for child_id, _ in units[1:]
+        ]
+    )
+
+@router.get('/attendance/trend/{unit_id}', response_model=AttendanceTrendReport)
+@cached_response("attendance", "organization_units", "user_organization_units", "users")
+@max_queries(2)
+def read_attendance_trend_by_unit(
+    unit_id: int,
+    start_date: date = Query(..., alias="from"),
+    end_date: date = Query(..., alias="to"),
+    granularity: TrendGranularity = TrendGranularity.WEEK,
+    db: Session = Depends(get_db)
+):
+    """
+    Get the attendance time series of an organization unit and its sub-units
+    
+    Args:
+        unit_id: The ID of the organization unit
+        start_date: First day of the range (query parameter "from")
+        end_date: Last day of the range (query parameter "to")
+        granularity: Period size, "week" (Monday to Sunday) or "month"
+    """
+    if start_date > end_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="'from' must not be later than 'to'"
+        )
+    if count_periods(start_date, end_date, granularity) > MAX_TREND_PERIODS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"The range covers more than {MAX_TREND_PERIODS} periods, use a shorter range or a larger granularity"
         )
+
+    try:
+        tree = get_org_tree()
+        unit = tree.get(unit_id)
+        
+        if not unit:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Organization unit not found"
+            )
+
+        # The subtree is resolved once and the whole range aggregated in one query
+        rows = query_attendance_trend(db, tree.subtree_ids(unit_id), start_date, end_date, granularity)
+        return build_attendance_trend(rows, unit.unit_name, start_date, end_date, granularity)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
-        )
\ No newline at end of file
+        )
+
+@router.get('/attendance/export')
+def export_attendance(
+    request: Request,
+    start_date: Optional[date] = Query(None, alias="from"),
+    end_date: Optional[date] = Query(None, alias="to"),
+    unit_id: Optional[int] = None,
+    meeting_type: Optional[schemas.MeetingType] = None,
+    format: ExportFormat = ExportFormat.CSV
+):
+    """
+    Download attendance records, one row per record
+    
+    Args:
+        start_date: First meeting date to include (query parameter "from")
+        end_date: Last meeting date to include (query parameter "to")
+        unit_id: Only members of this unit and its sub-units
+        meeting_type: Only this meeting type
+        format: "csv" or "ndjson"
+        
+    Returns:
+        StreamingResponse: Records ordered by meeting date, streamed in batches
+    """
+    MA = models.Meeting_attendance
+    query = select(
+        MA.id,
+        MA.meeting_date,
+        MA.meeting_type,
+        MA.user_id,
+        models.User.name,
+        models.User.level,
+        MA.created_at
+    ).join(
+        models.User, models.User.id == MA.user_id
+    ).order_by(MA.meeting_date, MA.id)
+
+    if start_date is not None:
+        query = query.where(MA.meeting_date >= start_date)
+    if end_date is not None:
+        query = query.where(MA.meeting_date <= end_date)
+    if meeting_type is not None:
+        query = query.where(MA.meeting_type == meeting_type)
+    if unit_id is not None:
+        tree = get_org_tree()
+        if tree.get(unit_id) is None:
+            raise HTTPException(status_code=404, detail="Organization unit not found")
+        query = query.where(
+            MA.user_id.in_(
+                select(models.User_organization_units.user_id).where(
+                    models.User_organization_units.unit_id.in_(list(tree.subtree_ids(unit_id)))
+                )
+            )
+        )
+
+    return stream_export(
+        query,
+        ["id", "meeting_date", "meeting_type", "user_id", "name", "level", "created_at"],
+        format,
+        "attendance",
+        session_factory(request)
+    )
@@ -0,0 +1,102 @@
+"""
+Schema checks against the database
+
+The indexes and constraints declared in app/models.py must match the database.
+Run this after `alembic upgrade head`; it exits with status 1 if they have drifted:
+
+    python -m app.schema_check
+
+At startup, wait_for_schema_version only checks that the database is at the
+Alembic head revision, which takes a single query.
+"""
+import logging
+from pathlib import Path
+import sys
+import time
+from typing import List
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy.engine import Engine
+from .models import Base
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "alembic"
+
+# Autogenerate diff kinds that concern indexes and constraints
+CHECKED_DIFFS = {
+    "add_index",
+    "remove_index",
+    "add_constraint",
+    "remove_constraint",
+    "add_fk",
+    "remove_fk",
+}
+
+
+def find_schema_drift(connection) -> List[tuple]:
+    """
+    Compare the models' indexes and constraints with the connected database
+
+    Args:
+        connection: An open SQLAlchemy connection
+
+    Returns:
+        List[tuple]: Alembic autogenerate diffs, empty when the schema matches
+    """
+    context = MigrationContext.configure(connection)
+    return [
+        diff
+        for diff in compare_metadata(context, Base.metadata)
+        # Column and type diffs come as lists of changes; only the index and
+        # constraint diffs are tuples named by their kind
+        if isinstance(diff, tuple) and diff[0] in CHECKED_DIFFS
+    ]
+
+
+def expected_heads() -> set:
+    """Get the head revisions of the migration scripts"""
+    return set(ScriptDirectory(str(MIGRATIONS_DIR)).get_heads())
+
+
+def wait_for_schema_version(engine: Engine, timeout: float) -> None:
+    """
+    Wait until the database is at the Alembic head revision
+
+    The migration may still be running when the workers boot, so the version
+    is polled for up to timeout seconds.
+
+    Raises:
+        RuntimeError: If the database is not at the head revision in time
+    """
+    heads = expected_heads()
+    deadline = time.monotonic() + timeout
+    while True:
+        with engine.connect() as connection:
+            current = set(MigrationContext.configure(connection).get_current_heads())
+        if current == heads:
+            return
+        if time.monotonic() >= deadline:
+            raise RuntimeError(
+                f"Database schema is at revision {sorted(current) or 'none'}, expected {sorted(heads)}; "
+                "run `alembic upgrade head`"
+            )
+        time.sleep(1)
+
+
+def main() -> None:
+    from .database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    with engine.connect() as connection:
+        drift = find_schema_drift(connection)
+    for diff in drift:
+        logger.error("Schema drift: %s %s", diff[0], diff[1])
+    if drift:
+        sys.exit(1)
+    logger.info("Model indexes and constraints match the database")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,9 +8,18 @@ T = TypeVar('T')
 
 class PaginatedResponse(BaseModel, Generic[T]):
     items: List[T]
-    total: int
-    skip: int
+    # None when the count was not requested
+    total: Optional[int] = None
+    skip: int = 0
     limit: int
+    # Pass as ?after= to get the next page, None on the last page
+    next_cursor: Optional[int] = None
+
+class BatchResponse(BaseModel, Generic[T]):
+    # In the order of the requested IDs, repeated IDs included
+    items: List[T]
+    # Requested IDs that do not exist
+    missing: List[int] = []
 
 # User schemas
 class UserLevel(str, Enum):
@@ -57,6 +66,20 @@ class UserInDB(UserBase):
     class Config:
         from_attributes = True
 
+class UserImportRow(UserCreate):
+    # Optional unit the imported user is assigned to
+    unit_id: Optional[int] = None
+
+class UserImportRowError(BaseModel):
+    # Line number in the uploaded file
+    line: int
+    errors: List[str]
+
+class UserImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: List[UserImportRowError]
+
 # Organization Category schemas
 class OrganizationCategoryBase(BaseModel):
     category_name: str
@@ -160,4 +183,53 @@ class WeeklyAttendanceReport(BaseModel):
     end_date: date
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class UnitWeeklyAttendanceReport(WeeklyAttendanceReport):
+    unit_id: int
+
+class ChildUnitsWeeklyAttendanceReport(BaseModel):
+    # The whole subtree of the unit, as /attendance/weekly/report/{unit_id}
+    total: UnitWeeklyAttendanceReport
+    # One report per direct child unit, covering the child's subtree
+    children: List[UnitWeeklyAttendanceReport]
+
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+class TrendGranularity(str, Enum):
+    WEEK = "week"
+    MONTH = "month"
+
+class AttendanceCounts(BaseModel):
+    christian_count: int = 0
+    vip_count: int = 0
+    new_friend_count: int = 0
+    total_count: int = 0
+
+class AttendanceTrendPoint(BaseModel):
+    period_start: date
+    period_end: date
+    sunday_service: AttendanceCounts
+    group_meeting: AttendanceCounts
+    unique: AttendanceCounts
+
+class AttendanceTrendReport(BaseModel):
+    unit_name: str
+    granularity: TrendGranularity
+    start_date: date
+    end_date: date
+    points: List[AttendanceTrendPoint]
+
+class UnitMemberOption(BaseModel):
+    id: int
+    name: str
+
+class UnitOption(BaseModel):
+    id: int
+    unit_name: str
+    category_id: int
+    children: List["UnitOption"] = []
+    # Direct members of the unit, only when requested
+    members: Optional[List[UnitMemberOption]] = None
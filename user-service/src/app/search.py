@@ -0,0 +1,58 @@
+"""
+User search for typeahead inputs
+
+Matches are found with ILIKE '%q%' on name, email and mobile number, which the
+pg_trgm GIN indexes on those columns serve, and ranked by trigram similarity.
+"""
+import re
+from typing import Iterable, Optional
+from sqlalchemy import func, or_, select
+from sqlalchemy.sql import Select
+from . import models
+from .serialization import USER_COLUMNS
+
+SEARCH_COLUMNS = (models.User.name, models.User.email, models.User.mobile_number)
+
+_LIKE_SPECIAL = re.compile(r"([\\%_])")
+
+
+def like_pattern(term: str) -> str:
+    """Build a '%term%' pattern matching the term literally, escaped with backslashes"""
+    return "%" + _LIKE_SPECIAL.sub(r"\\\1", term) + "%"
+
+
+def user_search_query(
+    term: str,
+    limit: int,
+    unit_ids: Optional[Iterable[int]] = None,
+    level: Optional[str] = None
+) -> Select:
+    """
+    Build the search query for users matching a term
+
+    Args:
+        term: Text to find in the name, email or mobile number
+        limit: Maximum number of users
+        unit_ids: Only members of these units, if given
+        level: Only users of this level
+
+    Returns:
+        Select: USER_COLUMNS rows, best matches first
+    """
+    pattern = like_pattern(term)
+    query = select(*USER_COLUMNS).where(
+        # Postgres escapes with backslash by default, spelled out for other databases
+        or_(*(column.ilike(pattern, escape="\\") for column in SEARCH_COLUMNS))
+    )
+    if level is not None:
+        query = query.where(models.User.level == level)
+    if unit_ids is not None:
+        query = query.where(
+            models.User.id.in_(
+                select(models.User_organization_units.user_id).where(
+                    models.User_organization_units.unit_id.in_(list(unit_ids))
+                )
+            )
+        )
+    rank = func.greatest(*(func.similarity(func.coalesce(column, ""), term) for column in SEARCH_COLUMNS))
+    return query.order_by(rank.desc(), models.User.name, models.User.id).limit(limit)
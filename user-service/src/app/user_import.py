@@ -0,0 +1,200 @@
+"""
+Bulk user import from CSV or JSONL uploads
+
+Rows are validated in batches against UserImportRow, loaded with COPY into a
+temporary staging table and merged into users and user_organization_units in
+the caller's transaction. Invalid rows are reported by line and skipped.
+"""
+import csv
+from datetime import date
+from enum import Enum
+import io
+from typing import Iterator, List, Optional, Sequence, Set, Tuple
+import orjson
+from pydantic import ValidationError
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+from . import models
+from .org_tree import OrgTree
+from .schemas import UserImportResult, UserImportRow, UserImportRowError
+
+IMPORT_BATCH_SIZE = 500
+
+STAGING_TABLE = "user_import_staging"
+STAGING_COLUMNS = ("line", "user_id", "name", "email", "birthday", "mobile_number", "level", "role", "unit_id")
+
+# A parsed line: (line number, fields) or (line number, parse error)
+ParsedLine = Tuple[int, object]
+
+
+def parse_upload(filename: str, content: bytes) -> Iterator[ParsedLine]:
+    """
+    Parse an uploaded .csv (with header row) or .jsonl/.ndjson file
+
+    Raises:
+        ValueError: If the file type is not supported or not UTF-8
+    """
+    text_content = content.decode("utf-8-sig")
+    if filename.lower().endswith(".csv"):
+        reader = csv.DictReader(io.StringIO(text_content))
+        for fields in reader:
+            # Empty cells are missing values
+            yield reader.line_num, {key: value or None for key, value in fields.items() if key}
+    elif filename.lower().endswith((".jsonl", ".ndjson")):
+        for line, raw in enumerate(text_content.splitlines(), start=1):
+            if not raw.strip():
+                continue
+            try:
+                fields = orjson.loads(raw)
+            except orjson.JSONDecodeError as e:
+                yield line, f"Invalid JSON: {str(e)}"
+                continue
+            if not isinstance(fields, dict):
+                yield line, "Each line must be a JSON object"
+                continue
+            yield line, fields
+    else:
+        raise ValueError("Upload a .csv, .jsonl or .ndjson file")
+
+
+def _batches(lines: Iterator[ParsedLine]) -> Iterator[List[ParsedLine]]:
+    batch = []
+    for parsed in lines:
+        batch.append(parsed)
+        if len(batch) == IMPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _validate_batch(
+    db: Session,
+    tree: OrgTree,
+    batch: Sequence[ParsedLine],
+    seen_emails: Set[str]
+) -> Tuple[List[Tuple[int, UserImportRow]], List[UserImportRowError]]:
+    valid = []
+    errors = []
+    for line, fields in batch:
+        if isinstance(fields, str):
+            errors.append(UserImportRowError(line=line, errors=[fields]))
+            continue
+        try:
+            valid.append((line, UserImportRow(**fields)))
+        except ValidationError as e:
+            errors.append(UserImportRowError(
+                line=line,
+                errors=[f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()]
+            ))
+
+    # One query per batch for the emails that are already registered
+    emails = [row.email for _, row in valid if row.email]
+    registered = set(
+        db.execute(select(models.User.email).where(models.User.email.in_(emails))).scalars()
+    ) if emails else set()
+
+    accepted = []
+    for line, row in valid:
+        row_errors = []
+        if row.email and (row.email in registered or row.email in seen_emails):
+            row_errors.append("email: Email already registered")
+        if row.unit_id is not None and tree.get(row.unit_id) is None:
+            row_errors.append("unit_id: Organization unit not found")
+        if row_errors:
+            errors.append(UserImportRowError(line=line, errors=row_errors))
+            continue
+        if row.email:
+            seen_emails.add(row.email)
+        accepted.append((line, row))
+    return accepted, errors
+
+
+def _copy_value(value) -> Optional[str]:
+    # Unquoted empty CSV fields are loaded as NULL
+    if value is None:
+        return None
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def _copy_into_staging(db: Session, rows: Sequence[Tuple[int, UserImportRow]]) -> None:
+    # IDs are preallocated from the users sequence so memberships can be
+    # inserted from the same staging rows
+    user_ids = db.execute(
+        select(func.nextval(func.pg_get_serial_sequence("users", "id"))).select_from(
+            func.generate_series(1, len(rows))
+        )
+    ).scalars().all()
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for user_id, (line, row) in zip(user_ids, rows):
+        writer.writerow([
+            _copy_value(value) for value in (
+                line, user_id, row.name, row.email, row.birthday,
+                row.mobile_number, row.level, row.role, row.unit_id
+            )
+        ])
+    buffer.seek(0)
+
+    db.execute(text(
+        f"CREATE TEMP TABLE {STAGING_TABLE} ("
+        "line integer NOT NULL, user_id integer NOT NULL, name varchar NOT NULL, "
+        "email varchar, birthday date, mobile_number varchar, level varchar NOT NULL, "
+        "role varchar NOT NULL, unit_id integer"
+        ") ON COMMIT DROP"
+    ))
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {STAGING_TABLE} ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+
+def _merge_staging(db: Session) -> None:
+    db.execute(text(
+        "INSERT INTO users (id, name, email, birthday, mobile_number, level, role) "
+        f"SELECT user_id, name, email, birthday, mobile_number, level, role FROM {STAGING_TABLE} ORDER BY line"
+    ))
+    db.execute(text(
+        "INSERT INTO user_organization_units (user_id, unit_id) "
+        f"SELECT user_id, unit_id FROM {STAGING_TABLE} WHERE unit_id IS NOT NULL ORDER BY line"
+    ))
+
+
+def import_users(db: Session, tree: OrgTree, filename: str, content: bytes) -> UserImportResult:
+    """
+    Import the valid rows of an upload inside the current transaction
+
+    Args:
+        db: Database session, committed by the caller
+        tree: Organization tree used to check the unit IDs
+        filename: Upload file name, its extension picks the format
+        content: Raw file content
+
+    Returns:
+        UserImportResult: Number of imported rows and the errors of the skipped ones
+
+    Raises:
+        ValueError: If the file type is not supported or not UTF-8
+    """
+    accepted = []
+    errors = []
+    seen_emails: Set[str] = set()
+    for batch in _batches(parse_upload(filename, content)):
+        batch_accepted, batch_errors = _validate_batch(db, tree, batch, seen_emails)
+        accepted.extend(batch_accepted)
+        errors.extend(batch_errors)
+
+    if accepted:
+        _copy_into_staging(db, accepted)
+        _merge_staging(db)
+
+    return UserImportResult(imported=len(accepted), failed=len(errors), errors=errors)
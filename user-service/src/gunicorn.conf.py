@@ -0,0 +1,60 @@
+# Gunicorn 設定：多個 uvicorn worker，各自擁有資料庫連線池
+#
+#   gunicorn -c src/gunicorn.conf.py main:app
+#
+# 可用環境變數調整：
+#   WEB_CONCURRENCY            worker 數量（預設為 CPU 核心數）
+#   DB_MAX_CONNECTIONS         所有 worker 對同一資料庫的連線總數上限，依 worker 數
+#                              平均分配給各 worker 的同步及非同步 engine
+#   DB_POOL_SIZE / DB_MAX_OVERFLOW   直接指定每個 worker 每個 engine 的連線池大小
+#   DB_PGBOUNCER               經由 PgBouncer 連線時設為 true，改由 PgBouncer 管理連線
+#   PROMETHEUS_MULTIPROC_DIR   各 worker 的 metrics 檔案共用目錄，/metrics 由此彙整
+#   METRICS_PORT               master 提供 /metrics 的埠（預設 9100，0 為停用），
+#                              不對外開放，只供內部網路的 Prometheus 抓取
+import multiprocessing
+import os
+import shutil
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+metrics_port = int(os.getenv("METRICS_PORT", "9100"))
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# 不預先載入 app：每個 worker 自行建立連線池、Redis 連線及組織樹監聽執行緒，
+# 避免 fork 後共用連線
+preload_app = False
+
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # 清除上次執行留下的 metrics 檔案
+    multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def when_ready(server):
+    # /metrics 不放在對外的 app 埠：由 master 在獨立的埠彙整所有 worker 的 metrics
+    if not metrics_port:
+        return
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        server.log.warning("PROMETHEUS_MULTIPROC_DIR is not set, /metrics is not served")
+        return
+    from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(metrics_port, registry=registry)
+    server.log.info(f"Serving /metrics on port {metrics_port}")
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,15 +1,31 @@
-from fastapi import FastAPI
+import time
+
+# 量測每個 worker 的啟動時間（自載入 app 起算）
+_import_started = time.perf_counter()
+
+import logging
+import os
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from app.cache import ResponseCacheMiddleware
 from app.routes import api
-from app.models import Base
-from app.database import engine
+from app.core.config import settings
+from app.database import engine, mark_primary_reads
+from app.metrics import WORKER_STARTUP, end_request, server_timing, start_request
+from app.schema_check import wait_for_schema_version
+
+logger = logging.getLogger("uvicorn.error")
 
 app = FastAPI(title="User Service API")
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# GET 回應快取（Redis + ETag），加在 CORS 之前使 CORS 位於最外層
+app.add_middleware(ResponseCacheMiddleware)
+
 # CORS 設置
 app.add_middleware(
     CORSMiddleware,
@@ -19,12 +35,45 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 寫入後的短時間內，同一用戶端的讀取改由主庫處理（read-your-writes）
+@app.middleware("http")
+async def stick_to_primary_after_writes(request: Request, call_next):
+    response = await call_next(request)
+    mark_primary_reads(request, response)
+    return response
+
+# 每個請求的延遲、SQL 查詢數、DB 時間及連線池等待時間，最外層以涵蓋快取命中
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    token = start_request()
+    start = time.perf_counter()
+    response = None
+    try:
+        response = await call_next(request)
+        return response
+    finally:
+        seconds = time.perf_counter() - start
+        route = request.scope.get("route")
+        stats = end_request(
+            token,
+            request.method,
+            route.path if route is not None else "unmatched",
+            response.status_code if response is not None else 500,
+            seconds
+        )
+        if response is not None:
+            response.headers["Server-Timing"] = server_timing(stats, seconds)
+
 # 設置靜態檔案目錄
 app.mount("/assets", StaticFiles(directory="src/assets"), name="assets")
 
 app.include_router(api.router)
 
-# 在應用啟動時創建資料表
+# 啟動時只確認資料庫已遷移至 Alembic head（資料表由 `alembic upgrade head` 建立），
+# 多個 worker 同時啟動時不會互相競爭
 @app.on_event("startup")
 async def startup():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    await run_in_threadpool(wait_for_schema_version, engine, settings.SCHEMA_WAIT_SECONDS)
+    seconds = time.perf_counter() - _import_started
+    WORKER_STARTUP.observe(seconds)
+    logger.info(f"Worker {os.getpid()} ready in {seconds * 1000:.0f} ms")
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import pytest
+
+from app import models
+from app.batch import MAX_BATCH_IDS, batch_body, parse_ids
+from app.database import get_db
+from app.org_tree import OrgTree, UnitNode
+from app.routes import api
+
+
+def test_parse_ids_keeps_request_order_and_repeats():
+    assert parse_ids(["3,1", "2", "1,,"]) == [3, 1, 2, 1]
+
+
+@pytest.mark.parametrize("values", [[""], ["1,x"], [",".join(["1"] * (MAX_BATCH_IDS + 1))]])
+def test_parse_ids_rejects_invalid_input(values):
+    with pytest.raises(ValueError):
+        parse_ids(values)
+
+
+def test_batch_body_orders_items_and_lists_missing_ids_once():
+    found = {1: "a", 3: "c"}
+    assert batch_body([3, 9, 1, 3, 9], found) == {"items": ["c", "a", "c"], "missing": [9]}
+
+
+@pytest.fixture
+def client(sqlite_engine, sqlite_session, monkeypatch):
+    models.Base.metadata.create_all(sqlite_engine, tables=[models.User.__table__])
+    for user_id in [1, 2, 3]:
+        sqlite_session.add(models.User(id=user_id, name=f"會友{user_id}", level="基督徒", role="會友"))
+    sqlite_session.commit()
+
+    created_at = datetime(2026, 10, 1)
+    tree = OrgTree([
+        UnitNode(id=unit_id, unit_name=f"unit {unit_id}", category_id=1, parent_unit_id=None,
+                 leader_id=None, created_at=created_at, updated_at=created_at)
+        for unit_id in [10, 20, 30]
+    ])
+
+    async def aget_org_tree():
+        return tree
+
+    monkeypatch.setattr(api, "aget_org_tree", aget_org_tree)
+
+    app = FastAPI()
+    app.include_router(api.router)
+    app.dependency_overrides[get_db] = lambda: sqlite_session
+    return TestClient(app)
+
+
+def test_users_batch_follows_request_order(client):
+    response = client.get("/users/batch", params={"ids": "3,99,1,3"})
+    assert response.status_code == 200
+    body = response.json()
+    assert [user["id"] for user in body["items"]] == [3, 1, 3]
+    assert body["missing"] == [99]
+
+
+def test_users_batch_accepts_repeated_parameters(client):
+    response = client.get("/users/batch?ids=2&ids=1")
+    assert [user["id"] for user in response.json()["items"]] == [2, 1]
+
+
+def test_users_batch_rejects_invalid_ids(client):
+    assert client.get("/users/batch", params={"ids": "1,a"}).status_code == 400
+
+
+def test_organization_units_batch_follows_request_order(client):
+    response = client.get("/organization-units/batch", params={"ids": "30,10,40,40,30"})
+    assert response.status_code == 200
+    body = response.json()
+    assert [unit["id"] for unit in body["items"]] == [30, 10, 30]
+    assert body["missing"] == [40]
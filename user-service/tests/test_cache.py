@@ -0,0 +1,159 @@
+from datetime import date
+
+import fakeredis
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+import pytest
+
+from app import cache
+from app.cache import ResponseCacheMiddleware, cached_response, invalidate_cache_tags
+from app.core.config import settings
+
+
+class FakeDate(date):
+    current = date(2026, 10, 18)
+
+    @classmethod
+    def today(cls):
+        return cls.current
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    server = fakeredis.FakeServer()
+    sync_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    async_client = fakeredis.aioredis.FakeRedis(server=server)
+    monkeypatch.setattr(cache, "get_redis", lambda: sync_client)
+    monkeypatch.setattr(cache, "get_async_redis", lambda: async_client)
+    monkeypatch.setattr(cache, "date", FakeDate)
+    monkeypatch.setattr(FakeDate, "current", date(2026, 10, 18))
+    return sync_client
+
+
+@pytest.fixture
+def client(redis_server, calls):
+    app = FastAPI()
+    app.add_middleware(ResponseCacheMiddleware)
+
+    @app.get("/units")
+    @cached_response("organization_units")
+    def read_units():
+        calls.append("units")
+        return {"units": [1, 2]}
+
+    @app.get("/report")
+    @cached_response("attendance", today_params=("report_date",))
+    def read_report(report_date: date = None):
+        calls.append("report")
+        return {"report_date": (report_date or FakeDate.today()).isoformat()}
+
+    @app.get("/missing")
+    @cached_response("organization_units")
+    def read_missing():
+        calls.append("missing")
+        raise HTTPException(status_code=404, detail="Not found")
+
+    @app.get("/uncached")
+    def read_uncached():
+        calls.append("uncached")
+        return {}
+
+    # One event loop for every request, the async Redis client is bound to it
+    with TestClient(app) as client:
+        yield client
+
+
+def test_second_request_is_served_from_the_cache(client, calls):
+    first = client.get("/units")
+    second = client.get("/units")
+
+    assert first.headers["x-cache"] == "MISS"
+    assert second.headers["x-cache"] == "HIT"
+    assert second.json() == first.json()
+    assert second.headers["etag"] == first.headers["etag"]
+    assert calls == ["units"]
+
+
+def test_query_params_and_accept_are_part_of_the_key(client, calls):
+    client.get("/units")
+    client.get("/units", params={"page": 2})
+    client.get("/units", headers={"Accept": "application/msgpack"})
+    assert calls == ["units", "units", "units"]
+
+
+def test_matching_if_none_match_returns_304(client, calls):
+    etag = client.get("/units").headers["etag"]
+
+    response = client.get("/units", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    assert client.get("/units", headers={"If-None-Match": '"stale"'}).status_code == 200
+    assert calls == ["units"]
+
+
+def test_304_also_on_a_miss(client, redis_server, calls):
+    etag = client.get("/units").headers["etag"]
+    redis_server.flushall()
+    # The entry is gone, the endpoint reruns and builds the same body
+    assert client.get("/units", headers={"If-None-Match": etag}).status_code == 304
+    assert calls == ["units", "units"]
+
+
+def test_invalidating_a_tag_drops_its_entries_only(client, calls):
+    client.get("/units")
+    client.get("/report")
+
+    invalidate_cache_tags("organization_units")
+
+    assert client.get("/units").headers["x-cache"] == "MISS"
+    assert client.get("/report").headers["x-cache"] == "HIT"
+    assert calls == ["units", "report", "units"]
+
+
+def test_uncached_routes_and_errors_are_not_stored(client, calls):
+    client.get("/uncached")
+    assert "x-cache" not in client.get("/uncached").headers
+
+    assert client.get("/missing").status_code == 404
+    assert client.get("/missing").status_code == 404
+    assert calls == ["uncached", "uncached", "missing", "missing"]
+
+
+def test_sticky_window_after_a_write_is_not_stored(client, redis_server, calls, monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_REPLICA_URLS", ["postgresql://replica/userdb"])
+    invalidate_cache_tags("organization_units")
+    assert redis_server.exists("response_cache:tag:organization_units:written")
+
+    # A replica may not have replayed the write yet, so nothing is stored
+    assert client.get("/units").headers["x-cache"] == "MISS"
+    assert client.get("/units").headers["x-cache"] == "MISS"
+
+    redis_server.delete("response_cache:tag:organization_units:written")
+    client.get("/units")
+    assert client.get("/units").headers["x-cache"] == "HIT"
+    assert calls == ["units"] * 3
+
+
+def test_implicit_report_date_is_part_of_the_key(client, calls):
+    # Late Sunday, then Monday: a new week starts
+    assert client.get("/report").json() == {"report_date": "2026-10-18"}
+    assert client.get("/report").headers["x-cache"] == "HIT"
+
+    FakeDate.current = date(2026, 10, 19)
+    response = client.get("/report")
+    assert response.headers["x-cache"] == "MISS"
+    assert response.json() == {"report_date": "2026-10-19"}
+
+
+def test_explicit_report_date_is_cached_across_days(client, calls):
+    client.get("/report", params={"report_date": "2026-10-11"})
+    FakeDate.current = date(2026, 10, 19)
+    assert client.get("/report", params={"report_date": "2026-10-11"}).headers["x-cache"] == "HIT"
+    assert calls == ["report"]
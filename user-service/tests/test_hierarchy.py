@@ -0,0 +1,213 @@
+import fakeredis
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import models, org_tree as org_tree_module
+from app.core.config import settings
+from app.hierarchy import add_unit_to_closure, get_hierarchy_rows, move_unit_in_closure
+from app.org_tree import ORG_TREE_CHANNEL, ORG_TREE_VERSION_KEY, OrgTree, UnitNode
+
+Closure = models.Organization_unit_closure
+
+TABLES = [
+    models.User.__table__,
+    models.Organization_categories.__table__,
+    models.Organization_units.__table__,
+    Closure.__table__,
+]
+
+
+@pytest.fixture
+def db(sqlite_engine, sqlite_session):
+    models.Base.metadata.create_all(sqlite_engine, tables=TABLES)
+    return sqlite_session
+
+
+def add_unit(db, parents, unit_id, parent_unit_id):
+    db.add(models.Organization_units(id=unit_id, unit_name=f"unit {unit_id}", parent_unit_id=parent_unit_id))
+    db.flush()
+    add_unit_to_closure(db, unit_id, parent_unit_id)
+    parents[unit_id] = parent_unit_id
+
+
+def closure_rows(db):
+    return {(row.ancestor_id, row.descendant_id, row.depth) for row in db.query(Closure)}
+
+
+def expected_rows(parents):
+    # Every (ancestor, unit, depth) path, walked up the parent links
+    rows = set()
+    for unit_id in parents:
+        ancestor_id, depth = unit_id, 0
+        while ancestor_id is not None:
+            rows.add((ancestor_id, unit_id, depth))
+            ancestor_id, depth = parents[ancestor_id], depth + 1
+    return rows
+
+
+@pytest.fixture
+def tree(db):
+    #   1           7
+    #   ├── 2       └── 8
+    #   │   ├── 4
+    #   │   │   └── 6
+    #   │   └── 5
+    #   └── 3
+    parents = {}
+    for unit_id, parent_unit_id in [(1, None), (2, 1), (3, 1), (4, 2), (5, 2), (6, 4), (7, None), (8, 7)]:
+        add_unit(db, parents, unit_id, parent_unit_id)
+    assert closure_rows(db) == expected_rows(parents)
+    return parents
+
+
+def test_move_subtree_under_another_branch(db, tree):
+    move_unit_in_closure(db, 2, 8)
+    tree[2] = 8
+    assert closure_rows(db) == expected_rows(tree)
+    # The moved subtree keeps its internal paths
+    assert (2, 6, 2) in closure_rows(db)
+    assert (7, 6, 4) in closure_rows(db)
+    assert not any(ancestor_id == 1 and descendant_id in {2, 4, 5, 6} for ancestor_id, descendant_id, _ in closure_rows(db))
+
+
+def test_move_subtree_to_root(db, tree):
+    move_unit_in_closure(db, 4, None)
+    tree[4] = None
+    assert closure_rows(db) == expected_rows(tree)
+
+
+def test_move_leaf_up_one_level(db, tree):
+    move_unit_in_closure(db, 6, 1)
+    tree[6] = 1
+    assert closure_rows(db) == expected_rows(tree)
+
+
+@pytest.mark.parametrize("new_parent_unit_id", [2, 4, 6])
+def test_move_under_own_subtree_is_rejected(db, tree, new_parent_unit_id):
+    with pytest.raises(ValueError):
+        move_unit_in_closure(db, 2, new_parent_unit_id)
+    assert closure_rows(db) == expected_rows(tree)
+
+
+def test_hierarchy_rows_put_parents_before_children(db, tree):
+    rows = get_hierarchy_rows(db)
+    assert [(row.id, row.depth) for row in rows] == [(1, 0), (7, 0), (2, 1), (3, 1), (8, 1), (4, 2), (5, 2), (6, 3)]
+
+
+def test_loaded_tree_skips_cycles_in_the_hierarchy(db, tree):
+    # Legacy data: two units pointing at each other, unreachable from any root
+    db.add_all([
+        models.Organization_units(id=20, unit_name="unit 20", parent_unit_id=21),
+        models.Organization_units(id=21, unit_name="unit 21", parent_unit_id=20),
+    ])
+    db.flush()
+
+    rows = get_hierarchy_rows(db)
+    assert [(row.id, row.depth) for row in rows[-2:]] == [(20, None), (21, None)]
+
+    org_tree = OrgTree.load(db)
+    assert [node["id"] for node in org_tree.hierarchy()] == [1, 7]
+    assert [node["id"] for node in org_tree.hierarchy()[0]["children"]] == [2, 3]
+    assert org_tree.get(20).parent_unit_id == 21
+    assert org_tree.subtree_ids(20) == {20, 21}
+
+
+def unit_node(unit_id, parent_unit_id, category_id=1):
+    return UnitNode(id=unit_id, unit_name=f"unit {unit_id}", category_id=category_id, parent_unit_id=parent_unit_id,
+                    leader_id=None, created_at=None, updated_at=None)
+
+
+@pytest.fixture
+def org_tree():
+    # Same shape as the tree fixture, parents before children
+    return OrgTree([
+        unit_node(1, None, 1), unit_node(7, None, 1),
+        unit_node(2, 1, 2), unit_node(3, 1, 2), unit_node(8, 7, 2),
+        unit_node(4, 2, 3), unit_node(5, 2, 3),
+        unit_node(6, 4, 4),
+    ])
+
+
+def test_org_tree_descendants(org_tree):
+    assert org_tree.subtree_ids(1) == {1, 2, 3, 4, 5, 6}
+    assert org_tree.subtree_ids(2) == {2, 4, 5, 6}
+    assert org_tree.subtree_ids(6) == {6}
+    assert org_tree.subtree_ids(99) == frozenset()
+    assert org_tree.descendants[7] == {7, 8}
+
+
+def test_org_tree_ancestors(org_tree):
+    assert [unit.id for unit in org_tree.ancestors(6)] == [6, 4, 2, 1]
+    assert [unit.id for unit in org_tree.ancestors(7)] == [7]
+    assert org_tree.ancestors(99) == []
+
+
+def test_org_tree_lookups(org_tree):
+    assert [unit.id for unit in org_tree.children_of(2)] == [4, 5]
+    assert [unit.id for unit in org_tree.children_of(None)] == [1, 7]
+    assert [unit.id for unit in org_tree.in_category(2)] == [2, 3, 8]
+    assert org_tree.hierarchy()[0]["children"][0] == {
+        "id": 2, "name": "unit 2", "category_id": 2, "leader_id": None,
+        "children": [
+            {"id": 4, "name": "unit 4", "category_id": 3, "leader_id": None, "children": [
+                {"id": 6, "name": "unit 6", "category_id": 4, "leader_id": None, "children": []}
+            ]},
+            {"id": 5, "name": "unit 5", "category_id": 3, "leader_id": None, "children": []},
+        ]
+    }
+
+
+def test_org_tree_options(org_tree):
+    options = org_tree.options([org_tree.get(7)])
+    assert options == [{
+        "id": 7, "unit_name": "unit 7", "category_id": 1,
+        "children": [{"id": 8, "unit_name": "unit 8", "category_id": 2, "children": []}]
+    }]
+
+    members = {8: [{"id": 1, "name": "會友1"}]}
+    options = org_tree.options([org_tree.get(7)], members)
+    assert options[0]["members"] == []
+    assert options[0]["children"][0]["members"] == [{"id": 1, "name": "會友1"}]
+
+
+@pytest.fixture
+def cached_tree(db, tree, sqlite_engine, monkeypatch):
+    # A fresh process-wide cache that loads from the test database
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(org_tree_module, "SessionLocal", sessionmaker(bind=sqlite_engine))
+    monkeypatch.setattr(org_tree_module, "get_redis", lambda: redis_client)
+    monkeypatch.setattr(org_tree_module, "_ensure_listener", lambda: None)
+    monkeypatch.setattr(org_tree_module, "_tree", None)
+    monkeypatch.setattr(org_tree_module, "_tree_generation", -1)
+    monkeypatch.setattr(org_tree_module, "_generation", 0)
+    db.commit()
+    return redis_client
+
+
+def test_cached_tree_is_reused_until_invalidated(db, cached_tree):
+    pubsub = cached_tree.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(ORG_TREE_CHANNEL)
+
+    first = org_tree_module.get_org_tree()
+    assert org_tree_module.get_org_tree() is first
+
+    add_unit(db, {}, 9, 3)
+    db.commit()
+    # The write is not visible until the tree is invalidated
+    assert org_tree_module.get_org_tree().get(9) is None
+
+    org_tree_module.invalidate_org_tree()
+    rebuilt = org_tree_module.get_org_tree()
+    assert rebuilt is not first
+    assert 9 in rebuilt.subtree_ids(1)
+
+    # Other workers are told through the version key and channel
+    assert cached_tree.get(ORG_TREE_VERSION_KEY) == "1"
+    messages = [pubsub.get_message(timeout=0.1) for _ in range(3)]
+    assert [message["data"] for message in messages if message] == ["1"]
+
+
+def test_cached_tree_is_rebuilt_after_max_age(cached_tree, monkeypatch):
+    first = org_tree_module.get_org_tree()
+    monkeypatch.setattr(settings, "ORG_TREE_MAX_AGE_SECONDS", 0)
+    assert org_tree_module.get_org_tree() is not first
@@ -0,0 +1,119 @@
+from collections import namedtuple
+from datetime import datetime
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import pytest
+from sqlalchemy import select
+
+from app import models
+from app.database import get_db
+from app.org_tree import OrgTree, UnitNode
+from app.pagination import apply_keyset, keyset_page, slice_after
+from app.routes import api
+
+Item = namedtuple("Item", "id")
+
+# Gaps in the IDs, as after deletions
+USER_IDS = [1, 2, 4, 5, 7, 8, 9]
+
+
+@pytest.fixture
+def db(sqlite_engine, sqlite_session):
+    models.Base.metadata.create_all(sqlite_engine, tables=[models.User.__table__])
+    for user_id in reversed(USER_IDS):
+        sqlite_session.add(models.User(id=user_id, name=f"會友{user_id}", level="基督徒", role="會友"))
+    sqlite_session.commit()
+    return sqlite_session
+
+
+def fetch_page(db, after, limit):
+    rows = db.execute(apply_keyset(select(models.User.id), models.User.id, after, limit)).all()
+    return keyset_page(rows, limit)
+
+
+def test_keyset_pages_walk_every_row_once(db):
+    seen, after = [], 0
+    while after is not None:
+        page = fetch_page(db, after, 3)
+        seen.extend(row.id for row in page["items"])
+        after = page["next_cursor"]
+    assert seen == USER_IDS
+
+
+def test_next_cursor_is_the_last_id_while_rows_remain(db):
+    page = fetch_page(db, 2, 2)
+    assert [row.id for row in page["items"]] == [4, 5]
+    assert page["next_cursor"] == 5
+
+
+def test_next_cursor_is_none_on_the_last_page(db):
+    # Exactly limit rows left, the extra row fetched by apply_keyset is missing
+    page = fetch_page(db, 5, 3)
+    assert [row.id for row in page["items"]] == [7, 8, 9]
+    assert page["next_cursor"] is None
+
+    page = fetch_page(db, 9, 3)
+    assert page["items"] == []
+    assert page["next_cursor"] is None
+
+
+def test_total_is_none_unless_counted():
+    rows = [Item(1), Item(2), Item(3)]
+    assert keyset_page(rows, 2)["total"] is None
+    assert keyset_page(rows, 2, total=10) == {
+        "items": [Item(1), Item(2)], "total": 10, "skip": 0, "limit": 2, "next_cursor": 2
+    }
+
+
+@pytest.mark.parametrize("after, expected", [
+    (0, [1, 2, 4]),
+    (2, [4, 5, 7]),
+    (3, [4, 5, 7]),
+    (7, [8, 9]),
+    (9, []),
+])
+def test_slice_after_matches_apply_keyset(after, expected):
+    items = [Item(item_id) for item_id in USER_IDS]
+    assert [item.id for item in slice_after(items, after, 2)] == expected
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    created_at = datetime(2026, 10, 1)
+    tree = OrgTree([
+        UnitNode(id=unit_id, unit_name=f"unit {unit_id}", category_id=2, parent_unit_id=None,
+                 leader_id=None, created_at=created_at, updated_at=created_at)
+        for unit_id in [3, 6, 9, 12]
+    ])
+
+    async def aget_org_tree():
+        return tree
+
+    monkeypatch.setattr(api, "aget_org_tree", aget_org_tree)
+
+    app = FastAPI()
+    app.include_router(api.router)
+    app.dependency_overrides[get_db] = lambda: db
+    return TestClient(app)
+
+
+def test_after_replaces_skip_for_users(client):
+    body = client.get("/users/", params={"after": 2, "skip": 3, "limit": 2}).json()
+    assert [user["id"] for user in body["items"]] == [4, 5]
+    assert (body["skip"], body["total"], body["next_cursor"]) == (0, None, 5)
+
+
+def test_skip_without_after_keeps_offset_pagination(client):
+    body = client.get("/users/", params={"skip": 3, "limit": 2}).json()
+    assert [user["id"] for user in body] == [5, 7]
+
+
+def test_after_replaces_skip_for_cached_units(client):
+    body = client.get("/organization-units/by-category/2", params={"after": 3, "skip": 2, "limit": 2}).json()
+    assert [unit["id"] for unit in body["items"]] == [6, 9]
+    assert (body["skip"], body["total"], body["next_cursor"]) == (0, 4, 9)
+
+    body = client.get("/organization-units/by-category/2", params={"after": 9, "limit": 2}).json()
+    assert [unit["id"] for unit in body["items"]] == [12]
+    assert body["next_cursor"] is None
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+
+import pytest
+from sqlalchemy import text
+
+from app.metrics import end_request, instrument_engine, start_request
+from app.query_budget import QueryBudgetExceeded, max_queries, statement_shape
+
+
+def run_queries(engine, *statements):
+    with engine.connect() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+
+
+def test_statement_shape_strips_parameters_and_collapses_in_lists():
+    assert statement_shape("SELECT * FROM users WHERE id IN (?, ?, ?) AND name = 'a'") == \
+        statement_shape("SELECT *\n  FROM users WHERE id IN (?) AND name = 'bb'")
+    assert statement_shape("SELECT * FROM users WHERE id = %(id_1)s LIMIT 10") == \
+        "SELECT * FROM users WHERE id = ? LIMIT ?"
+
+
+def test_under_budget_passes(sqlite_engine):
+    with max_queries(2, engine=sqlite_engine, strict=True) as budget:
+        run_queries(sqlite_engine, "SELECT 1", "SELECT 2")
+    assert budget.count == 2
+    assert budget.violations() == []
+
+
+def test_over_budget_raises_when_strict(sqlite_engine):
+    with pytest.raises(QueryBudgetExceeded, match="3 queries, budget is 2"):
+        with max_queries(2, engine=sqlite_engine, strict=True):
+            run_queries(sqlite_engine, "SELECT 1", "SELECT 2", "SELECT 3")
+
+
+def test_over_budget_logs_when_not_strict(sqlite_engine, caplog):
+    with caplog.at_level(logging.WARNING, logger="app.query_budget"):
+        with max_queries(1, engine=sqlite_engine, strict=False, name="listing"):
+            run_queries(sqlite_engine, "SELECT 1", "SELECT 2")
+    assert "Query budget of listing exceeded: 2 queries, budget is 1" in caplog.text
+
+
+def test_repeated_statement_shape_is_a_violation(sqlite_engine):
+    # Within the total budget, but the same query in a loop
+    with pytest.raises(QueryBudgetExceeded, match=r"4x SELECT \?"):
+        with max_queries(10, max_repeats=3, engine=sqlite_engine, strict=True):
+            run_queries(sqlite_engine, "SELECT 1", "SELECT 2", "SELECT 3", "SELECT 4")
+
+
+def test_error_in_block_is_not_masked(sqlite_engine):
+    with pytest.raises(ZeroDivisionError):
+        with max_queries(0, engine=sqlite_engine, strict=True):
+            run_queries(sqlite_engine, "SELECT 1")
+            1 / 0
+
+
+def test_nested_budgets_both_count(sqlite_engine):
+    with max_queries(3, engine=sqlite_engine, strict=True) as outer:
+        run_queries(sqlite_engine, "SELECT 1")
+        with max_queries(2, engine=sqlite_engine, strict=True) as inner:
+            run_queries(sqlite_engine, "SELECT 2", "SELECT 3")
+    assert (outer.count, inner.count) == (3, 2)
+
+
+def test_decorator_gives_each_call_its_own_budget(sqlite_engine):
+    @max_queries(1, engine=sqlite_engine, strict=True)
+    def read_one():
+        run_queries(sqlite_engine, "SELECT 1")
+
+    @max_queries(1, engine=sqlite_engine, strict=True)
+    def read_two():
+        run_queries(sqlite_engine, "SELECT 1", "SELECT 2")
+
+    read_one()
+    read_one()
+    with pytest.raises(QueryBudgetExceeded, match="read_two"):
+        read_two()
+
+
+def test_decorator_on_async_function(sqlite_engine):
+    @max_queries(1, engine=sqlite_engine, strict=True)
+    async def read_two():
+        run_queries(sqlite_engine, "SELECT 1", "SELECT 2")
+
+    with pytest.raises(QueryBudgetExceeded, match="2 queries, budget is 1"):
+        asyncio.run(read_two())
+
+
+def test_request_stats_count_queries(sqlite_engine):
+    instrument_engine(sqlite_engine)
+    token = start_request()
+    run_queries(sqlite_engine, "SELECT 1", "SELECT 2", "SELECT 3")
+    stats = end_request(token, "GET", "/test", 200, 0.01)
+    assert stats.query_count == 3
+    assert stats.db_seconds >= 0
+
+    # Queries outside a request are not counted anywhere
+    run_queries(sqlite_engine, "SELECT 4")
+    assert stats.query_count == 3
@@ -0,0 +1,234 @@
+"""
+The summary-backed weekly report must equal the report computed from raw records
+
+legacy_weekly_report is the route's algorithm before the aggregation moved to
+SQL and then to unit_weekly_attendance_summary, kept here as the reference.
+The per-user update applied on submission must leave the same summaries as a
+full recompute, and the child units report must agree with the single-unit one.
+"""
+from datetime import date, timedelta
+import random
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import pytest
+from sqlalchemy import and_
+
+from app import models, schemas
+from app.database import get_db
+from app.hierarchy import add_unit_to_closure
+from app.org_tree import OrgTree
+from app.routes import api
+from app.rollup import read_weekly_reports, refresh_user_week_summaries, refresh_weekly_summaries
+from app.schemas import AttendanceStats, WeeklyAttendanceReport
+
+WEEKS = [date(2026, 10, 5), date(2026, 10, 12)]
+
+# unit_id: (name, parent_unit_id)
+UNITS = {
+    1: ("第1分堂", None),
+    2: ("1-1區", 1),
+    3: ("1-2區", 1),
+    4: ("1-1-1小組", 2),
+    5: ("1-1-2小組", 2),
+    6: ("1-2-1小組", 3),
+}
+GROUP_IDS = [4, 5, 6]
+LEVELS = [level.value for level in schemas.UserLevel]
+
+
+def seed(db, rng: random.Random) -> None:
+    for unit_id, (name, parent_unit_id) in UNITS.items():
+        db.add(models.Organization_units(id=unit_id, unit_name=name, parent_unit_id=parent_unit_id))
+        db.flush()
+        add_unit_to_closure(db, unit_id, parent_unit_id)
+
+    for user_id in range(1, 31):
+        db.add(models.User(
+            id=user_id,
+            name=f"會友{user_id:02d}",
+            level=LEVELS[user_id % len(LEVELS)],
+            role=schemas.UserRole.MEMBER.value
+        ))
+    db.flush()
+    for user_id in range(1, 31):
+        db.add(models.User_organization_units(user_id=user_id, unit_id=GROUP_IDS[user_id % len(GROUP_IDS)]))
+    # A member of two groups is counted once in their common ancestors
+    db.add(models.User_organization_units(user_id=1, unit_id=6))
+
+    records = []
+    for week_start in WEEKS:
+        for user_id in range(1, 31):
+            if rng.random() < 0.7:
+                records.append((user_id, schemas.MeetingType.SUNDAY_SERVICE, week_start + timedelta(days=6)))
+            # Some groups meet twice in a week
+            for weekday in rng.sample(range(6), rng.choice([0, 1, 1, 2])):
+                records.append((user_id, schemas.MeetingType.GROUP_MEETING, week_start + timedelta(days=weekday)))
+    # Interleave the records of different users and weeks, as real submissions do
+    rng.shuffle(records)
+    for user_id, meeting_type, meeting_date in records:
+        db.add(models.Meeting_attendance(user_id=user_id, meeting_type=meeting_type, meeting_date=meeting_date))
+    db.flush()
+
+
+def subtree_ids(db, unit_id: int):
+    return [
+        row.descendant_id
+        for row in db.query(models.Organization_unit_closure).filter(
+            models.Organization_unit_closure.ancestor_id == unit_id
+        )
+    ]
+
+
+def legacy_weekly_report(db, unit_id: int, start_date: date, end_date: date) -> WeeklyAttendanceReport:
+    unit = db.query(models.Organization_units).filter(models.Organization_units.id == unit_id).first()
+    unit_members = db.query(models.User).distinct().join(
+        models.User_organization_units,
+        models.User.id == models.User_organization_units.user_id
+    ).filter(
+        models.User_organization_units.unit_id.in_(subtree_ids(db, unit_id))
+    ).all()
+
+    sunday_stats = {"christian_count": 0, "vip_count": 0, "new_friend_count": 0, "total_count": 0, "attendees": []}
+    group_stats = {"christian_count": 0, "vip_count": 0, "new_friend_count": 0, "total_count": 0, "attendees": []}
+    unique_stats = {"christian_count": 0, "vip_count": 0, "new_friend_count": 0, "total_count": 0, "attendees": []}
+
+    # The legacy query had no ORDER BY and returned the records in insertion order
+    attendance_records = db.query(models.Meeting_attendance).join(
+        models.User,
+        models.Meeting_attendance.user_id == models.User.id
+    ).filter(
+        and_(
+            models.Meeting_attendance.meeting_date >= start_date,
+            models.Meeting_attendance.meeting_date <= end_date,
+            models.User.id.in_([member.id for member in unit_members])
+        )
+    ).order_by(models.Meeting_attendance.id).all()
+
+    for record in attendance_records:
+        user = next(m for m in unit_members if m.id == record.user_id)
+        attendee_info = {"id": user.id, "name": user.name, "level": user.level}
+
+        if record.meeting_type == schemas.MeetingType.SUNDAY_SERVICE:
+            stats = sunday_stats
+        else:
+            stats = group_stats
+
+        if user.level == schemas.UserLevel.CHRISTIAN:
+            stats["christian_count"] += 1
+        elif user.level == schemas.UserLevel.VIP:
+            stats["vip_count"] += 1
+        elif user.level == schemas.UserLevel.NEW_FRIEND:
+            stats["new_friend_count"] += 1
+
+        stats["total_count"] += 1
+        if attendee_info not in stats["attendees"]:
+            stats["attendees"].append(attendee_info)
+
+    for attendee in sunday_stats["attendees"] + group_stats["attendees"]:
+        if attendee not in unique_stats["attendees"]:
+            unique_stats["attendees"].append(attendee)
+            if attendee["level"] == schemas.UserLevel.CHRISTIAN:
+                unique_stats["christian_count"] += 1
+            elif attendee["level"] == schemas.UserLevel.VIP:
+                unique_stats["vip_count"] += 1
+            elif attendee["level"] == schemas.UserLevel.NEW_FRIEND:
+                unique_stats["new_friend_count"] += 1
+
+    return WeeklyAttendanceReport(
+        sunday_service=AttendanceStats(**sunday_stats),
+        group_meeting=AttendanceStats(**group_stats),
+        unique=AttendanceStats(**unique_stats),
+        unit_name=unit.unit_name,
+        start_date=start_date,
+        end_date=end_date
+    )
+
+
+@pytest.mark.parametrize("seed_value", [1, 2, 3])
+def test_summary_report_matches_legacy_report(pg_session, seed_value):
+    db = pg_session
+    seed(db, random.Random(seed_value))
+    refresh_weekly_summaries(db)
+
+    units = [(unit_id, name) for unit_id, (name, _) in UNITS.items()]
+    for week_start in WEEKS:
+        week_end = week_start + timedelta(days=6)
+        reports = read_weekly_reports(db, units, week_start, week_end)
+        for unit_id, _ in units:
+            expected = legacy_weekly_report(db, unit_id, week_start, week_end)
+            assert reports[unit_id].model_dump_json() == expected.model_dump_json(), (unit_id, week_start)
+
+
+def summary_rows(db):
+    summary = models.Unit_weekly_attendance_summary
+    # The refreshes write through Core, so drop the loaded rows
+    db.expire_all()
+    return [
+        (row.unit_id, row.week_start, row.meeting_type, row.level, row.attendance_count,
+         row.attendee_count, row.attendee_ids, row.first_record_ids, row.record_counts)
+        for row in db.query(summary).order_by(
+            summary.unit_id, summary.week_start, summary.meeting_type, summary.level
+        )
+    ]
+
+
+@pytest.mark.parametrize("seed_value", [1, 2, 3])
+def test_user_week_update_matches_full_refresh(pg_session, seed_value):
+    db = pg_session
+    rng = random.Random(seed_value)
+    seed(db, rng)
+    refresh_weekly_summaries(db)
+
+    # Resubmit one day as the attendance form does: replace the chosen users'
+    # records on that date, dropping some attendees entirely
+    week_start = WEEKS[0]
+    meeting_date = week_start + timedelta(days=rng.randrange(7))
+    user_ids = sorted(rng.sample(range(1, 31), 12))
+    db.query(models.Meeting_attendance).filter(
+        models.Meeting_attendance.user_id.in_(user_ids),
+        models.Meeting_attendance.meeting_date == meeting_date
+    ).delete(synchronize_session=False)
+    for user_id in user_ids:
+        for meeting_type in schemas.MeetingType:
+            if rng.random() < 0.5:
+                db.add(models.Meeting_attendance(user_id=user_id, meeting_type=meeting_type, meeting_date=meeting_date))
+    db.flush()
+
+    refresh_user_week_summaries(db, user_ids, week_start)
+    updated = summary_rows(db)
+
+    refresh_weekly_summaries(db)
+    assert updated == summary_rows(db)
+
+
+@pytest.mark.parametrize("seed_value", [1, 2, 3])
+def test_child_units_report_matches_the_unit_reports(pg_session, monkeypatch, seed_value):
+    db = pg_session
+    seed(db, random.Random(seed_value))
+    refresh_weekly_summaries(db)
+
+    tree = OrgTree.load(db)
+    monkeypatch.setattr(api, "get_org_tree", lambda: tree)
+    app = FastAPI()
+    app.include_router(api.router)
+    app.dependency_overrides[get_db] = lambda: db
+    client = TestClient(app)
+
+    def unit_report(unit_id, report_date):
+        response = client.get(f"/attendance/weekly/report/{unit_id}", params={"report_date": report_date})
+        assert response.status_code == 200
+        return {"unit_id": unit_id, **response.json()}
+
+    for week_start in WEEKS:
+        report_date = (week_start + timedelta(days=3)).isoformat()
+        for unit_id in UNITS:
+            response = client.get(f"/attendance/weekly/report/{unit_id}/children", params={"report_date": report_date})
+            assert response.status_code == 200
+            body = response.json()
+
+            assert body["total"] == unit_report(unit_id, report_date), (unit_id, week_start)
+            child_ids = [child_id for child_id, (_, parent_unit_id) in UNITS.items() if parent_unit_id == unit_id]
+            assert [child["unit_id"] for child in body["children"]] == child_ids
+            for child in body["children"]:
+                assert child == unit_report(child["unit_id"], report_date), (child["unit_id"], week_start)
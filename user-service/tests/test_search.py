@@ -0,0 +1,125 @@
+"""
+User search against sqlite, with stand-ins for the pg_trgm functions
+
+similarity() is a trigram Jaccard index like pg_trgm's, enough to check the
+ranking; the ILIKE filtering and escaping run on sqlite itself.
+"""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import pytest
+from sqlalchemy import event
+
+from app import models
+from app.database import get_async_db
+from app.routes import api
+from app.search import like_pattern, user_search_query
+
+
+def trigrams(text):
+    grams = set()
+    for word in text.lower().split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(text, term):
+    a, b = trigrams(text or ""), trigrams(term or "")
+    return len(a & b) / len(a | b) if a | b else 0.0
+
+
+@pytest.mark.parametrize("term, pattern", [
+    ("林小明", "%林小明%"),
+    ("100%", "%100\\%%"),
+    ("a_b", "%a\\_b%"),
+    ("c:\\temp", "%c:\\\\temp%"),
+    ("%_\\", "%\\%\\_\\\\%"),
+])
+def test_like_pattern_escapes_wildcards(term, pattern):
+    assert like_pattern(term) == pattern
+
+
+@pytest.fixture
+def db(sqlite_engine, sqlite_session):
+    @event.listens_for(sqlite_engine, "connect")
+    def register_functions(dbapi_connection, connection_record):
+        dbapi_connection.create_function("similarity", 2, similarity)
+        dbapi_connection.create_function("greatest", -1, max)
+
+    models.Base.metadata.create_all(
+        sqlite_engine, tables=[models.User.__table__, models.User_organization_units.__table__]
+    )
+    users = [
+        (1, "林一百", "lin100@example.com", "基督徒"),
+        (2, "林百分", "score100%@example.com", "慕道友"),
+        (3, "王a_b", "wang@example.com", "基督徒"),
+        (4, "王axb", "wangx@example.com", "基督徒"),
+        (5, "陳c:\\temp", None, "新朋友"),
+        (6, "陳ctemp", None, "新朋友"),
+        (7, "Sam", "sam@example.com", "基督徒"),
+        (8, "Samuel", "samuel@example.com", "基督徒"),
+        (9, "Samantha", "samantha@example.com", "慕道友"),
+    ]
+    for user_id, name, email, level in users:
+        sqlite_session.add(models.User(id=user_id, name=name, email=email, level=level, role="會友"))
+    # User 8 is a member of two units
+    for user_id, unit_id in [(7, 10), (8, 10), (8, 11), (9, 12)]:
+        sqlite_session.add(models.User_organization_units(user_id=user_id, unit_id=unit_id))
+    sqlite_session.commit()
+    return sqlite_session
+
+
+def search(db, term, limit=20, unit_ids=None, level=None):
+    return [row.id for row in db.execute(user_search_query(term, limit, unit_ids, level))]
+
+
+@pytest.mark.parametrize("term, expected", [
+    ("100%", [2]),
+    ("a_b", [3]),
+    ("c:\\temp", [5]),
+    ("100", [1, 2]),
+])
+def test_wildcards_in_the_term_match_literally(db, term, expected):
+    assert sorted(search(db, term)) == expected
+
+
+def test_email_and_case_insensitive_matches(db):
+    assert search(db, "WANGX") == [4]
+
+
+def test_best_matches_come_first(db):
+    assert search(db, "sam") == [7, 8, 9]
+
+
+def test_limit_bounds_the_results(db):
+    assert search(db, "sam", limit=2) == [7, 8]
+    assert search(db, "example", limit=3) == search(db, "example")[:3]
+
+
+def test_search_is_scoped_to_the_units(db):
+    assert search(db, "sam", unit_ids={10}) == [7, 8]
+    # Members of several of the units are listed once
+    assert search(db, "sam", unit_ids={10, 11, 12}) == [7, 8, 9]
+    assert search(db, "sam", unit_ids=set()) == []
+
+
+def test_search_by_level(db):
+    assert search(db, "sam", level="慕道友") == [9]
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(api.router)
+    app.dependency_overrides[get_async_db] = lambda: None
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("params", [
+    {"q": "sam", "limit": 0},
+    {"q": "sam", "limit": 101},
+    {"q": ""},
+    {"q": "s" * 101},
+])
+def test_route_rejects_out_of_bounds_parameters(client, params):
+    assert client.get("/users/search", params=params).status_code == 422
@@ -0,0 +1,107 @@
+from datetime import date, datetime, timezone
+from typing import List
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+import msgpack
+import pytest
+
+from app import schemas
+from app.core.config import settings
+from app.org_tree import UnitNode
+from app.serialization import (
+    MSGPACK_MEDIA_TYPE,
+    UNIT_FIELDS,
+    USER_FIELDS,
+    fast_response,
+    objects_to_dicts,
+    rows_to_dicts,
+)
+
+CREATED_AT = datetime(2026, 10, 18, 13, 30, 5, 123456, tzinfo=timezone.utc)
+
+# Tuples in the order of USER_FIELDS, as selected by the user listings
+USER_ROWS = [
+    ("會友甲", "a@example.com", date(1990, 1, 2), "0912345678", schemas.UserLevel.CHRISTIAN,
+     schemas.UserRole.MEMBER, 1, CREATED_AT, None),
+    ("會友乙", None, None, None, schemas.UserLevel.NEW_FRIEND, schemas.UserRole.GROUP_LEADER, 2, CREATED_AT, CREATED_AT),
+]
+
+UNITS = [
+    UnitNode(id=3, unit_name="第1分堂", category_id=1, parent_unit_id=None, leader_id=1,
+             created_at=CREATED_AT, updated_at=None),
+]
+
+
+def make_request(accept: str = "") -> Request:
+    headers = [(b"accept", accept.encode())] if accept else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_rows_and_objects_to_dicts():
+    assert rows_to_dicts([(1, "a"), (2, "b")], ("id", "name")) == [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]
+    assert objects_to_dicts(UNITS, ("id", "unit_name")) == [{"id": 3, "unit_name": "第1分堂"}]
+
+
+def test_content_is_returned_unchanged_when_fast_serialization_is_off(monkeypatch):
+    monkeypatch.setattr(settings, "FAST_SERIALIZATION", False)
+    content = rows_to_dicts(USER_ROWS, USER_FIELDS)
+    assert fast_response(make_request("application/json"), content) is content
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.get("/users", response_model=List[schemas.UserInDB])
+    def read_users(request: Request):
+        return fast_response(request, rows_to_dicts(USER_ROWS, USER_FIELDS), utc_z=True)
+
+    @app.get("/units", response_model=List[schemas.OrganizationUnitInDB])
+    def read_units(request: Request):
+        return fast_response(request, objects_to_dicts(UNITS, UNIT_FIELDS))
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("path", ["/users", "/units"])
+def test_orjson_output_matches_the_response_model(client, monkeypatch, path):
+    monkeypatch.setattr(settings, "FAST_SERIALIZATION", False)
+    validated = client.get(path)
+    monkeypatch.setattr(settings, "FAST_SERIALIZATION", True)
+    fast = client.get(path)
+
+    assert fast.headers["content-type"] == validated.headers["content-type"] == "application/json"
+    assert fast.content == validated.content
+
+
+def test_dates_and_enums_are_encoded_as_strings(client, monkeypatch):
+    monkeypatch.setattr(settings, "FAST_SERIALIZATION", True)
+    user = client.get("/users").json()[0]
+    assert user["birthday"] == "1990-01-02"
+    assert user["created_at"] == "2026-10-18T13:30:05.123456Z"
+    assert (user["level"], user["role"]) == ("基督徒", "會友")
+
+    # OrganizationUnitInDB encodes datetimes with isoformat()
+    assert client.get("/units").json()[0]["created_at"] == "2026-10-18T13:30:05.123456+00:00"
+
+
+@pytest.mark.parametrize("fast_serialization", [False, True])
+def test_msgpack_is_served_when_accepted(client, monkeypatch, fast_serialization):
+    monkeypatch.setattr(settings, "FAST_SERIALIZATION", fast_serialization)
+    response = client.get("/users", headers={"Accept": f"{MSGPACK_MEDIA_TYPE}, application/json;q=0.5"})
+
+    assert response.headers["content-type"] == MSGPACK_MEDIA_TYPE
+    users = msgpack.unpackb(response.content)
+    assert users == client.get("/users").json()
+    assert users[1]["level"] == "新朋友"
+    assert users[1]["updated_at"] == "2026-10-18T13:30:05.123456Z"
+
+
+@pytest.mark.parametrize("accept", [None, "application/json", "*/*", "text/html,application/xhtml+xml"])
+def test_other_accept_headers_get_json(client, monkeypatch, accept):
+    monkeypatch.setattr(settings, "FAST_SERIALIZATION", True)
+    headers = {"Accept": accept} if accept else {}
+    response = client.get("/units", headers=headers)
+    assert response.headers["content-type"] == "application/json"
+    assert response.json()[0]["unit_name"] == "第1分堂"
@@ -0,0 +1,99 @@
+from collections import namedtuple
+from datetime import date
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import pytest
+
+from app import schemas
+from app.database import get_db
+from app.reports import MAX_TREND_PERIODS, build_attendance_trend, count_periods
+from app.routes import api
+from app.schemas import TrendGranularity
+
+Row = namedtuple("Row", "period_start meeting_type level is_unique record_count attendee_count")
+
+CHRISTIAN = schemas.UserLevel.CHRISTIAN.value
+VIP = schemas.UserLevel.VIP.value
+SUNDAY = schemas.MeetingType.SUNDAY_SERVICE
+GROUP = schemas.MeetingType.GROUP_MEETING
+
+
+def test_weekly_trend_fills_empty_weeks():
+    rows = [
+        Row(date(2026, 9, 7), SUNDAY, CHRISTIAN, 0, 5, 3),
+        Row(date(2026, 9, 7), SUNDAY, VIP, 0, 2, 2),
+        Row(date(2026, 9, 7), GROUP, CHRISTIAN, 0, 4, 4),
+        Row(date(2026, 9, 7), None, CHRISTIAN, 1, 9, 6),
+        Row(date(2026, 9, 21), None, VIP, 1, 1, 1),
+    ]
+    report = build_attendance_trend(rows, "第1分堂", date(2026, 9, 7), date(2026, 9, 27), TrendGranularity.WEEK)
+
+    assert [(point.period_start, point.period_end) for point in report.points] == [
+        (date(2026, 9, 7), date(2026, 9, 13)),
+        (date(2026, 9, 14), date(2026, 9, 20)),
+        (date(2026, 9, 21), date(2026, 9, 27)),
+    ]
+    first, empty, last = report.points
+    # Meeting types count records, unique counts attendees
+    assert first.sunday_service.model_dump() == {"christian_count": 5, "vip_count": 2, "new_friend_count": 0, "total_count": 7}
+    assert first.group_meeting.total_count == 4
+    assert first.unique.model_dump() == {"christian_count": 6, "vip_count": 0, "new_friend_count": 0, "total_count": 6}
+    assert empty.model_dump(include={"sunday_service", "group_meeting", "unique"}) == {
+        field: schemas.AttendanceCounts().model_dump() for field in ("sunday_service", "group_meeting", "unique")
+    }
+    assert last.unique.vip_count == 1
+
+
+def test_partial_first_and_last_weeks_span_whole_weeks():
+    # Wednesday to Tuesday
+    report = build_attendance_trend([], "第1分堂", date(2026, 9, 9), date(2026, 9, 22), TrendGranularity.WEEK)
+    assert [(point.period_start, point.period_end) for point in report.points] == [
+        (date(2026, 9, 7), date(2026, 9, 13)),
+        (date(2026, 9, 14), date(2026, 9, 20)),
+        (date(2026, 9, 21), date(2026, 9, 27)),
+    ]
+    assert (report.start_date, report.end_date) == (date(2026, 9, 9), date(2026, 9, 22))
+
+
+def test_monthly_trend_crosses_month_and_year_boundaries():
+    rows = [Row(date(2027, 2, 1), SUNDAY, CHRISTIAN, 0, 3, 3)]
+    report = build_attendance_trend(rows, "第1分堂", date(2026, 11, 15), date(2027, 2, 10), TrendGranularity.MONTH)
+
+    assert [(point.period_start, point.period_end) for point in report.points] == [
+        (date(2026, 11, 1), date(2026, 11, 30)),
+        (date(2026, 12, 1), date(2026, 12, 31)),
+        (date(2027, 1, 1), date(2027, 1, 31)),
+        (date(2027, 2, 1), date(2027, 2, 28)),
+    ]
+    assert report.points[-1].sunday_service.christian_count == 3
+
+
+@pytest.mark.parametrize("start_date, end_date, granularity", [
+    (date(2026, 9, 9), date(2026, 9, 22), TrendGranularity.WEEK),
+    (date(2026, 9, 7), date(2026, 9, 7), TrendGranularity.WEEK),
+    (date(2025, 12, 29), date(2027, 1, 3), TrendGranularity.WEEK),
+    (date(2026, 11, 15), date(2027, 2, 10), TrendGranularity.MONTH),
+    (date(2026, 1, 31), date(2026, 1, 31), TrendGranularity.MONTH),
+])
+def test_count_periods_matches_the_built_points(start_date, end_date, granularity):
+    report = build_attendance_trend([], "第1分堂", start_date, end_date, granularity)
+    assert count_periods(start_date, end_date, granularity) == len(report.points)
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(api.router)
+    app.dependency_overrides[get_db] = lambda: None
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("params", [
+    {"from": "0001-01-01", "to": "9999-12-31"},
+    {"from": "2000-01-03", "to": "2026-10-18", "granularity": "month"},
+])
+def test_trend_rejects_too_many_periods(client, params):
+    response = client.get("/attendance/trend/1", params=params)
+    assert response.status_code == 400
+    assert str(MAX_TREND_PERIODS) in response.json()["detail"]
@@ -0,0 +1,130 @@
+import pytest
+
+from app.org_tree import OrgTree, UnitNode
+from app.user_import import _validate_batch, parse_upload
+
+TREE = OrgTree([
+    UnitNode(id=5, unit_name="1-1-1小組", category_id=3, parent_unit_id=None,
+             leader_id=None, created_at=None, updated_at=None),
+])
+
+
+class RegisteredEmails:
+    """Stands in for the session in the one query _validate_batch runs"""
+
+    def __init__(self, *emails):
+        self.emails = list(emails)
+        self.queries = 0
+
+    def execute(self, statement):
+        self.queries += 1
+        return self
+
+    def scalars(self):
+        return iter(self.emails)
+
+
+def user(name="王小明", level="基督徒", role="會友", **fields):
+    return {"name": name, "level": level, "role": role, **fields}
+
+
+def test_csv_lines_are_numbered_from_the_header():
+    content = (
+        "name,email,level,role,unit_id\n"
+        "王小明,ming@example.com,基督徒,會友,5\n"
+        "陳大華,,慕道友,會友,\n"
+    ).encode()
+    assert list(parse_upload("users.CSV", content)) == [
+        (2, {"name": "王小明", "email": "ming@example.com", "level": "基督徒", "role": "會友", "unit_id": "5"}),
+        # Empty cells are missing values
+        (3, {"name": "陳大華", "email": None, "level": "慕道友", "role": "會友", "unit_id": None}),
+    ]
+
+
+def test_csv_with_byte_order_mark():
+    content = "\ufeffname,level,role\n王小明,基督徒,會友\n".encode()
+    assert list(parse_upload("users.csv", content)) == [(2, {"name": "王小明", "level": "基督徒", "role": "會友"})]
+
+
+def test_jsonl_reports_bad_lines_and_keeps_numbering():
+    content = (
+        '{"name": "王小明", "level": "基督徒", "role": "會友"}\n'
+        "\n"
+        '{"name": "陳大華",\n'
+        '["not", "an", "object"]\n'
+        '{"name": "林美玲", "level": "新朋友", "role": "會友"}\n'
+    ).encode()
+    parsed = list(parse_upload("users.ndjson", content))
+
+    assert [line for line, _ in parsed] == [1, 3, 4, 5]
+    assert parsed[0][1]["name"] == "王小明"
+    assert parsed[1][1].startswith("Invalid JSON: ")
+    assert parsed[2][1] == "Each line must be a JSON object"
+    assert parsed[3][1]["name"] == "林美玲"
+
+
+@pytest.mark.parametrize("filename, content", [
+    ("users.xlsx", b"name\n"),
+    ("users.csv", "name\n王小明\n".encode("big5")),
+])
+def test_unsupported_uploads_are_rejected(filename, content):
+    with pytest.raises(ValueError):
+        list(parse_upload(filename, content))
+
+
+def test_invalid_rows_are_reported_per_field():
+    batch = [
+        (2, user(email="ming@example.com")),
+        (3, user(name="王", level="會員", mobile_number="12345")),
+        (4, "Invalid JSON: unexpected end of data"),
+    ]
+    accepted, errors = _validate_batch(RegisteredEmails(), TREE, batch, set())
+
+    assert [(line, row.email) for line, row in accepted] == [(2, "ming@example.com")]
+    assert [error.line for error in errors] == [3, 4]
+    assert [message.split(":")[0] for message in errors[0].errors] == ["name", "mobile_number", "level"]
+    assert errors[1].errors == ["Invalid JSON: unexpected end of data"]
+
+
+def test_duplicate_emails_within_the_file_are_rejected():
+    seen_emails = set()
+    first_batch = [
+        (2, user(email="ming@example.com")),
+        (3, user(email="ming@example.com")),
+        (4, user(email="hua@example.com")),
+    ]
+    accepted, errors = _validate_batch(RegisteredEmails(), TREE, first_batch, seen_emails)
+    assert [line for line, _ in accepted] == [2, 4]
+    assert [(error.line, error.errors) for error in errors] == [(3, ["email: Email already registered"])]
+
+    # Also across batches of the same upload
+    accepted, errors = _validate_batch(RegisteredEmails(), TREE, [(5, user(email="hua@example.com"))], seen_emails)
+    assert accepted == []
+    assert [error.line for error in errors] == [5]
+
+
+def test_registered_emails_are_looked_up_once_per_batch():
+    db = RegisteredEmails("ming@example.com")
+    batch = [(2, user(email="ming@example.com")), (3, user(email="hua@example.com")), (4, user())]
+    accepted, errors = _validate_batch(db, TREE, batch, set())
+
+    assert db.queries == 1
+    assert [line for line, _ in accepted] == [3, 4]
+    assert [(error.line, error.errors) for error in errors] == [(2, ["email: Email already registered"])]
+
+    # No emails in the batch, no query
+    db = RegisteredEmails()
+    _validate_batch(db, TREE, [(2, user())], set())
+    assert db.queries == 0
+
+
+def test_unknown_unit_is_rejected_with_other_errors():
+    seen_emails = {"ming@example.com"}
+    batch = [(2, user(unit_id=5)), (3, user(unit_id=99)), (4, user(email="ming@example.com", unit_id=99))]
+    accepted, errors = _validate_batch(RegisteredEmails(), TREE, batch, seen_emails)
+
+    assert [(line, row.unit_id) for line, row in accepted] == [(2, 5)]
+    assert [(error.line, error.errors) for error in errors] == [
+        (3, ["unit_id: Organization unit not found"]),
+        (4, ["email: Email already registered", "unit_id: Organization unit not found"]),
+    ]